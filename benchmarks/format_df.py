@@ -0,0 +1,97 @@
+import argparse
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.data import (DATASET_PATH, create_price_type, country_name, color_name,
+                        to_dolar, rename_columns, format_df)
+
+# Benchmark: row-wise format_df (the original apply/lambda version) against
+# the vectorized utils.data.format_df, on the shipped csv repeated up to
+# millions of rows. Run from the repo root:
+#
+#   python -m benchmarks.format_df --sizes 7500 100000 1000000 5000000
+
+
+def format_df_rowwise(dataframe):
+    # The original row-wise format_df (as the Restaurants page had it),
+    # kept unchanged as the reference output
+    df = rename_columns(dataframe)
+    # Removing NaN
+    df = df.loc[~df['cuisines'].isna(),:]
+    # Removing columns
+    df = df.drop(columns=['switch_to_order_menu'])
+    # Column price_range_type
+    df['price_range_type'] = df['price_range'].apply(lambda x: create_price_type(x) )
+    # Column country_name
+    df['country_name'] = df['country_code'].apply(lambda x: country_name(x))  
+    # Columns color_name
+    df['color_name'] = df['rating_color'].apply(lambda x: color_name(x) ) 
+    # Cuisines
+    df['cuisines'] = df.loc[:, 'cuisines'].apply(lambda x: x.split(",")[0])
+    # Changing types
+    df.loc[: , ['restaurant_id','country_code']] = df.loc[: , ['restaurant_id','country_code']].astype(str)
+    # Dolar conversion
+    df['dolar_price'] = df[['average_cost_for_two','country_name']].apply(lambda x: x['average_cost_for_two'] / to_dolar(x['country_name']), axis=1).round(2)
+    df = df.loc[ df['dolar_price'] < 17006814.29 ]
+    # Convert boolean colums
+    df['has_delivery'] = df['has_online_delivery'].apply(lambda x: True if x == 1 else False)
+    df['has_booking'] = df['has_table_booking'].apply(lambda x: True if x == 1 else False)
+    # Reset index
+    df = df.reset_index(drop=True)
+    
+    return df
+
+def comparable(df):
+    # Values only: categories as their values, ids as the strings the
+    # original produced (format_df keeps restaurant_id an integer)
+    df = df.astype({col: object for col in df.select_dtypes('category').columns})
+    return df.astype({'restaurant_id': str, 'country_code': str})
+
+def assert_same_values(vectorized, reference):
+    # Same columns, rows and values; dtypes may differ (compact schema) and
+    # float32 coordinates match to their precision
+    pd.testing.assert_frame_equal(comparable(vectorized), comparable(reference), check_dtype=False, rtol=1e-6)
+
+def scale_frame(raw, n_rows):
+    # Repeat the raw rows until n_rows
+    idx = np.resize(np.arange(len(raw)), n_rows)
+    return raw.iloc[idx].reset_index(drop=True)
+
+def timeit(func, df, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = func(df)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+def main():
+    parser = argparse.ArgumentParser(description='format_df row-wise vs vectorized')
+    parser.add_argument('--path', default=DATASET_PATH)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[7500, 75000, 750000, 3000000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-rowwise', type=int, default=750000,
+                        help='skip the row-wise version above this many rows')
+    args = parser.parse_args()
+
+    raw = pd.read_csv(args.path)
+    print('{:>10} {:>12} {:>12} {:>9}'.format('rows', 'rowwise (s)', 'vector (s)', 'speedup'))
+    for n_rows in args.sizes:
+        df = scale_frame(raw, n_rows)
+        vec_time, vec_out = timeit(format_df, df, args.repeat)
+
+        if n_rows <= args.max_rowwise:
+            with warnings.catch_warnings():
+                # the original's id cast warns on recent pandas
+                warnings.simplefilter('ignore', FutureWarning)
+                row_time, row_out = timeit(format_df_rowwise, df, 1)
+            assert_same_values(vec_out, row_out)
+            print('{:>10} {:>12.3f} {:>12.3f} {:>8.1f}x'.format(n_rows, row_time, vec_time, row_time / vec_time))
+        else:
+            print('{:>10} {:>12} {:>12.3f} {:>9}'.format(n_rows, '-', vec_time, '-'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import base64
+import copy
+import gzip
+import json
+import time
+
+import numpy as np
+import plotly.express as px
+import plotly.io as pio
+
+from benchmarks.format_df import scale_frame
+from utils.data import load_dataset
+from utils.figures import TypedArrayFigure, dual_axis_chart, encode_arrays
+from utils.geo import cluster_points, density_grid
+
+# Benchmark: chart payloads as plain JSON lists against base64 typed arrays
+# (utils.figures.typed_arrays). For each figure it reports the JSON size,
+# gzipped size, time to serialize (what st.plotly_chart does per rerun),
+# time to parse the payload back including the typed-array decode (a proxy
+# for the browser side) and the largest error of the float32 values.
+#
+#   python -m benchmarks.payload --scale 1 10 100
+
+
+def figures(df):
+    # The chart shapes of the app on df
+    city = df.groupby('city', observed=True).agg(restaurants=('restaurant_id', 'nunique'),
+                                                  mean=('aggregate_rating', 'mean')).round(2).reset_index()
+    cuisines = df.groupby('cuisines', observed=True).agg(average_cost_for_two=('average_cost_for_two', 'mean'),
+                                                         aggregate_rating=('aggregate_rating', 'mean')).round(2).reset_index()
+    return {
+        'map points': px.scatter_mapbox(df, lat='latitude', lon='longitude', color='has_delivery',
+                                        size='average_cost_for_two', hover_name='restaurant_name', zoom=1),
+        'map clusters': px.scatter_mapbox(cluster_points(df, 4, 'cuisines'), lat='latitude', lon='longitude',
+                                          color='cuisines', size='count', hover_data=['count', 'mean_rating'], zoom=4),
+        'density': px.density_mapbox(density_grid(df)[0.0625], lat='latitude', lon='longitude', z='count'),
+        'scatter': px.scatter(cuisines, x='average_cost_for_two', y='aggregate_rating'),
+        'city bars': dual_axis_chart(city, x='city', bar='restaurants', line='mean', bar_name='Restaurants by City'),
+    }
+
+def decode(node):
+    # Parse typed arrays back to numpy, as plotly.js does
+    for key, value in node.items():
+        if isinstance(value, dict) and 'bdata' in value:
+            node[key] = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']))
+        elif isinstance(value, dict):
+            decode(value)
+    return node
+
+def max_error(plain, typed):
+    # Largest absolute difference between numeric arrays of two trace dicts
+    error = 0.0
+    for key, value in plain.items():
+        if isinstance(value, dict) and isinstance(typed.get(key), dict):
+            error = max(error, max_error(value, typed[key]))
+        elif isinstance(typed.get(key), np.ndarray) and not isinstance(value, dict):
+            values = np.asarray(value, dtype=float).ravel()
+            error = max(error, float(np.nanmax(np.abs(values - typed[key].astype(float)), initial=0)))
+    return error
+
+def measure(fig, repeat):
+    best_dump = best_load = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = pio.to_json(fig, validate=False)
+        best_dump = min(best_dump, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        parsed = json.loads(payload)
+        for trace in parsed['data']:
+            decode(trace)
+        best_load = min(best_load, time.perf_counter() - start)
+    return payload, parsed, best_dump, best_load
+
+def main():
+    parser = argparse.ArgumentParser(description='chart payloads: JSON lists vs typed arrays')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10],
+                        help='times the dataset is repeated (coordinates jittered)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    base = load_dataset()
+    rng = np.random.default_rng(0)
+    print('{:>6} {:<13} {:>11} {:>11} {:>9} {:>9} {:>10} {:>10} {:>9} {:>9} {:>9}'.format(
+        'scale', 'figure', 'json (B)', 'typed (B)', 'gz json', 'gz typed',
+        'dump (ms)', 'typed (ms)', 'load (ms)', 'typed', 'max err'))
+    for scale in args.scale:
+        df = scale_frame(base, len(base) * scale)
+        # spread the repeated rows so they do not stack on the same points
+        df['latitude'] = df['latitude'] + rng.normal(0, 0.01, len(df)).astype(np.float32)
+        df['longitude'] = df['longitude'] + rng.normal(0, 0.01, len(df)).astype(np.float32)
+
+        for name, fig in figures(df).items():
+            plain, plain_parsed, plain_dump, plain_load = measure(fig, args.repeat)
+            typed_fig = copy.copy(fig)
+            typed_fig.__class__ = TypedArrayFigure
+            typed, typed_parsed, typed_dump, typed_load = measure(typed_fig, args.repeat)
+            error = max(max_error(p, t) for p, t in zip(plain_parsed['data'], typed_parsed['data']))
+
+            print('{:>6} {:<13} {:>11} {:>11} {:>9} {:>9} {:>10.1f} {:>10.1f} {:>9.1f} {:>9.1f} {:>9.2g}'.format(
+                scale, name, len(plain), len(typed),
+                len(gzip.compress(plain.encode())), len(gzip.compress(typed.encode())),
+                plain_dump * 1000, typed_dump * 1000, plain_load * 1000, typed_load * 1000, error))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+import argparse
+import gc
+import glob
+import os
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+import utils.data
+from benchmarks.format_df import scale_frame
+from utils.data import file_hash, snapshot_path
+from utils.trace import rss_bytes
+
+# Load test: N simulated sessions driving a page script at the same time
+# through Streamlit's app-testing API (streamlit.testing.v1.AppTest), in one
+# process like the server, which runs each session's script in its own
+# thread. After a first run every session makes --steps scripted filter
+# interactions, each one a rerun, picked at random (seeded by session) among
+# the widgets the page shows at that point. Reported per script: rerun latency
+# percentiles, reruns per second over the whole phase, the share of runs
+# that failed (raised, or rendered no widget to interact with) and the
+# resident memory added per live session (shared caches filled by the phase
+# included).
+#
+#   python -m benchmarks.sessions --sessions 8 --steps 20
+#   python -m benchmarks.sessions --sessions 32 --scale 10 --scripts pages/1_Company.py
+#   python -m benchmarks.sessions --dataset datasets/synthetic.csv.zip
+#
+# Home.py is driven like the pages; a script that fails its first run is
+# reported with the error and skipped.
+
+SCRIPTS = ['Home.py'] + sorted(glob.glob('pages/*.py'))
+
+
+def subset(rng, options, most):
+    # 0 to `most` distinct options (none = the page default, everything)
+    size = int(rng.integers(0, min(most, len(options)) + 1))
+    return [options[i] for i in rng.choice(len(options), size, replace=False)]
+
+def nudge(w, rng, degrees):
+    # A position up to `degrees` away from the current one, as a user
+    # moving around the map would type in
+    value = w.value + rng.uniform(-degrees, degrees)
+    return round(float(np.clip(value, w.min, w.max)), 4)
+
+# (widget type, label, new value given the widget and the session rng)
+ACTIONS = [
+    ('multiselect', 'Choose the country:', lambda w, rng: subset(rng, w.options, 2)),
+    ('multiselect', 'Choose the city:', lambda w, rng: subset(rng, w.options, 3)),
+    ('multiselect', 'Choose the price range:', lambda w, rng: subset(rng, w.options, 2)),
+    ('slider', 'Choose the maximum price (USD) desired:', lambda w, rng: int(rng.integers(w.min, w.max + 1))),
+    ('radio', 'Has delivery?', lambda w, rng: w.options[rng.integers(len(w.options))]),
+    ('checkbox', 'Has Booking?', lambda w, rng: not w.value),
+    ('radio', 'Map - Identify by:', lambda w, rng: w.options[rng.integers(len(w.options))]),
+    # Geographic View
+    ('slider', 'Map zoom:', lambda w, rng: int(rng.integers(w.min, w.max + 1))),
+    ('selectbox', 'Center the map on:', lambda w, rng: w.options[rng.integers(len(w.options))]),
+    ('radio', 'Map mode:', lambda w, rng: w.options[rng.integers(len(w.options))]),
+    ('radio', 'Heat by:', lambda w, rng: w.options[rng.integers(len(w.options))]),
+    ('number_input', 'My latitude:', lambda w, rng: nudge(w, rng, 0.1)),
+    ('number_input', 'My longitude:', lambda w, rng: nudge(w, rng, 0.1)),
+    ('slider', 'Within (km):', lambda w, rng: int(rng.integers(w.min, w.max + 1))),
+    ('slider', 'How many restaurants:', lambda w, rng: int(rng.integers(w.min, w.max + 1))),
+]
+
+
+def widget(at, kind, label):
+    for element in getattr(at, kind):
+        if element.label == label:
+            return element
+    return None
+
+def errors_of(at):
+    return [e.message for e in at.exception]
+
+def run(at):
+    # Seconds of one run of the script and its errors; a run that raises
+    # is an error too
+    start = time.perf_counter()
+    try:
+        at.run()
+    except Exception as exc:
+        return time.perf_counter() - start, ['{}: {}'.format(type(exc).__name__, exc)]
+    return time.perf_counter() - start, errors_of(at)
+
+def run_session(script, number, steps, seed, timeout):
+    # (first run seconds, [rerun seconds], [errors], AppTest). A step with
+    # no widget to change (a run that rendered nothing, which concurrent
+    # AppTests sometimes return) counts as an error and reruns the script.
+    rng = np.random.default_rng([seed, number])
+    at = AppTest.from_file(script, default_timeout=timeout)
+    first, errors = run(at)
+    if errors:
+        return first, [], errors, at
+
+    reruns = []
+    for _ in range(steps):
+        available = [(kind, label, choose) for kind, label, choose in ACTIONS if widget(at, kind, label) is not None]
+        if available:
+            kind, label, choose = available[rng.integers(len(available))]
+            element = widget(at, kind, label)
+            element.set_value(choose(element, rng))
+        else:
+            errors.append('no widget to interact with (empty render)')
+        seconds, step_errors = run(at)
+        reruns.append(seconds)
+        errors.extend(step_errors)
+    return first, reruns, errors, at
+
+def run_script(script, sessions, steps, seed, timeout):
+    # Warm the shared dataset cache alone, then every session at once
+    _, errors = run(AppTest.from_file(script, default_timeout=timeout))
+    if errors:
+        return {'script': script, 'error': errors[0]}
+
+    gc.collect()
+    rss = rss_bytes()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda n: run_session(script, n, steps, seed, timeout), range(sessions)))
+    wall = time.perf_counter() - start
+    gc.collect()
+    per_session = (rss_bytes() - rss) / sessions / 2**20
+
+    reruns = np.array([seconds for _, times, _, _ in results for seconds in times])
+    firsts = np.array([first for first, _, _, _ in results])
+    errors = [error for _, _, errs, _ in results for error in errs]
+    del results
+
+    report = {'script': script, 'sessions': sessions, 'reruns': len(reruns), 'errors': len(errors),
+              'error_pct': 100 * len(errors) / (len(reruns) + sessions),
+              'first_ms': np.median(firsts) * 1000, 'throughput': (len(reruns) + sessions) / wall,
+              'session_mb': per_session, 'error': errors[0] if errors else None}
+    for q in (50, 90, 99):
+        report['p{}_ms'.format(q)] = np.percentile(reruns, q) * 1000 if len(reruns) else float('nan')
+    report['max_ms'] = reruns.max() * 1000 if len(reruns) else float('nan')
+    return report
+
+def scaled_dataset(directory, scale):
+    # The shipped csv repeated `scale` times
+    path = os.path.join(directory, 'zomato_x{}.csv'.format(scale))
+    raw = pd.read_csv(utils.data.DATASET_PATH)
+    scale_frame(raw, len(raw) * scale).to_csv(path, index=False)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description='concurrent sessions driving the page scripts')
+    parser.add_argument('--scripts', nargs='+', default=SCRIPTS)
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=20, help='interactions (reruns) per session')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=int, default=1, help='times the shipped csv rows are repeated')
+    parser.add_argument('--dataset', help='another export to load instead (e.g. from utils.synth)')
+    parser.add_argument('--timeout', type=float, default=300, help='seconds allowed per rerun')
+    args = parser.parse_args()
+    # page errors are counted in the report, not logged
+    warnings.filterwarnings('ignore')
+    set_log_level('critical')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.dataset:
+            utils.data.DATASET_PATH = args.dataset
+        elif args.scale > 1:
+            utils.data.DATASET_PATH = scaled_dataset(tmp, args.scale)
+        path = utils.data.DATASET_PATH
+        print('dataset {} ({} sessions x {} reruns)'.format(path, args.sessions, args.steps))
+
+        print('{:<28} {:>8} {:>7} {:>6} {:>7} {:>10} {:>9} {:>9} {:>9} {:>9} {:>10} {:>11}'.format(
+            'script', 'sessions', 'reruns', 'errors', 'error %', 'first (ms)', 'p50 (ms)', 'p90 (ms)', 'p99 (ms)',
+            'max (ms)', 'reruns/s', 'MB/session'))
+        try:
+            for script in args.scripts:
+                report = run_script(os.path.abspath(script), args.sessions, args.steps, args.seed, args.timeout)
+                if 'sessions' not in report:
+                    print('{:<28} failed: {}'.format(script, report['error'].splitlines()[0]))
+                    continue
+                print('{:<28} {sessions:>8} {reruns:>7} {errors:>6} {error_pct:>7.1f} {first_ms:>10.1f} {p50_ms:>9.1f} {p90_ms:>9.1f} '
+                      '{p99_ms:>9.1f} {max_ms:>9.1f} {throughput:>10.1f} {session_mb:>11.2f}'.format(script, **report), flush=True)
+                if report['error']:
+                    print('    first error: {}'.format(report['error'].splitlines()[0]))
+        finally:
+            # the snapshot of a scaled copy is of no use once it is gone
+            if path.startswith(tmp) and os.path.exists(path):
+                target = snapshot_path(path, file_hash(path))
+                if os.path.exists(target):
+                    os.remove(target)
+
+if __name__ == '__main__':
+    main()
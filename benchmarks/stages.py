@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.format_df import scale_frame
+from utils.cube import Cube
+from utils.data import DATASET_PATH, rename_columns, format_df
+from utils.figures import dual_axis_chart, figure_cache
+from utils.filters import FilterIndex
+from utils.geo import SpatialIndex, cluster_points, density_grid, viewport
+from utils.plan import Aggregation, execute, fold_top
+from utils.topk import top_k
+
+import plotly.express as px
+import plotly.io as pio
+
+# Benchmark suite: every stage of a page run timed on its own, on the
+# shipped csv and on copies scaled up by repeating its rows. For each
+# (stage, scale) it records the best wall time over --repeat runs and the
+# peak memory traced (tracemalloc) during one more run, and compares them
+# with a stored baseline:
+#
+#   python -m benchmarks.stages --scales 1 10 100 --save      # write the baseline
+#   python -m benchmarks.stages --scales 1 10 100             # compare, exit 1 on regressions
+#
+# A stage regresses when its time or peak memory is more than --tolerance
+# (relative) above the baseline and the difference is above the noise
+# floors (--min-seconds, --min-mb).
+#
+# Timings only compare on the same hardware, so baselines are kept per
+# machine in benchmarks/baselines/<machine>.json and committed. The machine
+# name is ZOMATO_BENCH_MACHINE (set it on CI runners to a stable name) or
+# else <os>-<arch>-<cpus>cpu. A compare run without a baseline for its
+# machine, or with stages the baseline lacks, fails: record one with --save
+# on that machine and commit it.
+
+BASELINE_DIR = 'benchmarks/baselines'
+MACHINE = os.environ.get('ZOMATO_BENCH_MACHINE') or '{}-{}-{}cpu'.format(
+    platform.system().lower(), platform.machine().lower(), os.cpu_count())
+
+# The sidebar state the stages filter with: two countries, every price
+# range, delivery only, price up to 300
+SELECTIONS = {'country_name': ['India', 'Brazil'], 'has_delivery': [True]}
+MAX_COST = 300
+
+METRICS = {'restaurants': ('restaurant_id', 'nunique'), 'mean': ('aggregate_rating', 'mean'),
+           'rows': ('restaurant_id', 'size')}
+PLAN = [
+    Aggregation('home', [], METRICS),
+    Aggregation('country_rests', ['country_name'], METRICS),
+    Aggregation('city_rests', ['city'], METRICS),
+    Aggregation('cuisines', ['cuisines'], METRICS),
+    Aggregation('price_types', ['cuisines', 'price_range_type'], {'restaurant_id': ('restaurant_id', 'nunique')}),
+]
+
+
+def stages(csv_path):
+    # [(stage, function of the previous outputs)], run in order; every
+    # function gets the dict of outputs so far and returns its own
+    def read_csv(out):
+        return pd.read_csv(csv_path)
+
+    def rename(out):
+        return rename_columns(out['read_csv'])
+
+    def format(out):
+        return format_df(out['read_csv'])
+
+    def filter_index(out):
+        return FilterIndex(out['format'])
+
+    def filter(out):
+        index = out['filter_index']
+        return out['format'].iloc[np.flatnonzero(index.select(SELECTIONS, MAX_COST))]
+
+    def cube(out):
+        return Cube(out['format'])
+
+    def rollup(out):
+        return [out['cube'].rollup(by, {'country_name': SELECTIONS['country_name'],
+                                        'has_delivery': SELECTIONS['has_delivery']}, MAX_COST)
+                for by in (['country_name'], ['city'], ['cuisines'])]
+
+    def aggregates(out):
+        return execute(PLAN, out['filter'])[0]
+
+    def metrics(out):
+        df = out['filter']
+        return (top_k(df, 1, ['aggregate_rating', 'votes'], [False, False]),
+                top_k(df, 1, ['aggregate_rating', 'votes'], [True, False]))
+
+    def charts(out):
+        # the Company charts, built without the figure cache and serialized
+        figure_cache.clear()
+        results = out['aggregates']
+        payload = 0
+        for name, key in (('country_rests', 'country_name'), ('city_rests', 'city'), ('cuisines', 'cuisines')):
+            df_aux = fold_top(results[name], 20, 'restaurants', weights={'mean': 'rows'}).round(2).reset_index()
+            fig = dual_axis_chart(df_aux, x=key, bar='restaurants', line='mean', bar_name=name)
+            payload += len(pio.to_json(fig, validate=False))
+        return payload
+
+    def spatial_index(out):
+        return SpatialIndex(out['format'])
+
+    def map(out):
+        # what the Geographic View sends at zoom 5 around the filtered rows
+        df = out['filter']
+        box = viewport(df['latitude'].mean(), df['longitude'].mean(), 5)
+        rows = out['spatial_index'].in_box(box, rows=df.index.to_numpy())
+        clusters = cluster_points(out['format'].iloc[rows], 5, 'cuisines')
+        fig = px.scatter_mapbox(clusters, lat='latitude', lon='longitude', color='cuisines', size='count', zoom=5)
+        return len(pio.to_json(fig, validate=False))
+
+    def density(out):
+        return density_grid(out['filter'])
+
+    return [('read_csv', read_csv), ('rename', rename), ('format', format),
+            ('filter_index', filter_index), ('filter', filter), ('cube', cube), ('rollup', rollup),
+            ('aggregates', aggregates), ('metrics', metrics), ('charts', charts),
+            ('spatial_index', spatial_index), ('map', map), ('density', density)]
+
+def run_stage(func, out, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(out)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func(out)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak / 2**20
+
+def run(scales, repeat, path):
+    raw = pd.read_csv(path)
+    records = {}
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'zomato.csv')
+            scale_frame(raw, len(raw) * scale).to_csv(csv_path, index=False)
+            out = {}
+            for name, func in stages(csv_path):
+                out[name], seconds, peak_mb = run_stage(func, out, repeat)
+                records['{}@{}x'.format(name, scale)] = {'seconds': seconds, 'peak_mb': peak_mb}
+                print('{:>6}x {:<14} {:>10.4f} s {:>10.1f} MB'.format(scale, name, seconds, peak_mb), flush=True)
+            del out
+    return records
+
+def baseline_path(machine=MACHINE):
+    return os.path.join(BASELINE_DIR, machine + '.json')
+
+def compare(records, baseline, tolerance, min_seconds, min_mb):
+    # Rows of (stage, metric, baseline, now, ratio) that regressed; a stage
+    # missing from the baseline counts as one
+    regressions = []
+    print('\n{:<22} {:>11} {:>11} {:>8} {:>10} {:>10} {:>8}'.format(
+        'stage', 'base (s)', 'now (s)', 'ratio', 'base (MB)', 'now (MB)', 'ratio'))
+    for stage, now in records.items():
+        base = baseline.get(stage)
+        if base is None:
+            regressions.append((stage, 'missing', None, now['seconds'], None))
+            print('{:<22} {:>11} {:>11.4f} {:>8} {:>10} {:>10.1f} {:>8} MISSING'.format(stage, '-', now['seconds'], '-', '-', now['peak_mb'], '-'))
+            continue
+        time_ratio = now['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        mem_ratio = now['peak_mb'] / base['peak_mb'] if base['peak_mb'] else float('inf')
+        flags = ''
+        if time_ratio > 1 + tolerance and now['seconds'] - base['seconds'] > min_seconds:
+            regressions.append((stage, 'seconds', base['seconds'], now['seconds'], time_ratio))
+            flags += ' TIME'
+        if mem_ratio > 1 + tolerance and now['peak_mb'] - base['peak_mb'] > min_mb:
+            regressions.append((stage, 'peak_mb', base['peak_mb'], now['peak_mb'], mem_ratio))
+            flags += ' MEMORY'
+        print('{:<22} {:>11.4f} {:>11.4f} {:>7.2f}x {:>10.1f} {:>10.1f} {:>7.2f}x{}'.format(
+            stage, base['seconds'], now['seconds'], time_ratio, base['peak_mb'], now['peak_mb'], mem_ratio, flags))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='per-stage time and peak memory against a stored baseline')
+    parser.add_argument('--path', default=DATASET_PATH)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='times the csv rows are repeated (1000 needs several GB of memory)')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=baseline_path(),
+                        help='baseline file (default: the one of this machine, {})'.format(MACHINE))
+    parser.add_argument('--save', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-seconds', type=float, default=0.005)
+    parser.add_argument('--min-mb', type=float, default=1.0)
+    args = parser.parse_args()
+
+    records = run(args.scales, args.repeat, args.path)
+
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(records)
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1, sort_keys=True)
+        print('\nbaseline saved to {}'.format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print('\nno baseline at {} (record one with --save on this machine and commit it)'.format(args.baseline))
+        sys.exit(2)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(records, baseline, args.tolerance, args.min_seconds, args.min_mb)
+    if regressions:
+        print('\n{} regression(s)'.format(len(regressions)))
+        sys.exit(1)
+    print('\nno regressions')
+
+if __name__ == '__main__':
+    main()
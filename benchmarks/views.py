@@ -0,0 +1,64 @@
+import argparse
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.format_df import scale_frame
+from benchmarks.stages import PLAN
+from utils.data import load_dataset
+from utils.filters import FilteredView, get_filter_index
+from utils.plan import execute
+
+# Benchmark: memory a session holds for its filtered rows, as a copy of the
+# shared frame (df.iloc[rows], what filter_df returned before) against a
+# FilteredView (row positions only), and the peak traced (tracemalloc) while
+# a rerun answers the aggregation plan from each by a full scan.
+#
+#   python -m benchmarks.views --scale 1 10 100
+
+# Filter states from wide to narrow
+STATES = {
+    'everything': ({}, None),
+    'India': ({'country_name': ['India']}, None),
+    'two countries, delivery': ({'country_name': ['India', 'Brazil'], 'has_delivery': [True]}, 300),
+    'one city': ({'city': ['London']}, None),
+}
+
+
+def peak_mb(func):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 2**20
+
+def rerun(filtered):
+    execute(PLAN, filtered)
+    return filtered
+
+def main():
+    parser = argparse.ArgumentParser(description='filtered copies vs filtered views: memory per session')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10])
+    args = parser.parse_args()
+
+    base = load_dataset()
+    print('{:>6} {:<24} {:>9} {:>11} {:>11} {:>11} {:>11}'.format(
+        'scale', 'filter', 'rows', 'copy (MB)', 'view (MB)', 'peak copy', 'peak view'))
+    for scale in args.scale:
+        df = scale_frame(base, len(base) * scale)
+        index = get_filter_index(df)
+        for name, (selections, max_cost) in STATES.items():
+            rows = np.flatnonzero(index.select(selections, max_cost))
+
+            # the filtered rows and a plan answered from them
+            copy, copy_peak = peak_mb(lambda: rerun(df.iloc[rows]))
+            view, view_peak = peak_mb(lambda: rerun(FilteredView(df, rows)))
+
+            print('{:>6} {:<24} {:>9} {:>11.2f} {:>11.3f} {:>11.2f} {:>11.2f}'.format(
+                scale, name, len(rows), copy.memory_usage(deep=True).sum() / 2**20, view.nbytes() / 2**20,
+                copy_peak, view_peak))
+            del copy, view
+
+if __name__ == '__main__':
+    main()
@@ -4,115 +4,26 @@ import streamlit            as st
 import plotly.graph_objects as go 
 
 from plotly.subplots import make_subplots
-import inflection
-
-dataframe = pd.read_csv('datasets/zomato.csv')
-
-
-# Preenchimento do nome dos países
-
-def country_name(country_id):
-    COUNTRIES = {
-    1: "India",
-    14: "Australia",
-    30: "Brazil",
-    37: "Canada",
-    94: "Indonesia",
-    148: "New Zeland",
-    162: "Philippines",
-    166: "Qatar",
-    184: "Singapure",
-    189: "South Africa",
-    191: "Sri Lanka",
-    208: "Turkey",
-    214: "United Arab Emirates",
-    215: "England",
-    216: "United States of America",
-    }
-    return COUNTRIES[country_id]
-
-def to_dolar(country_name):
-    # Conversão dólar
-    CURRENCY = {
-     "India": 83,
-     "Australia": 1.47,
-     "Brazil": 5.20,
-     "Canada": 1.36,
-     "Indonesia": 15.97,
-     "New Zeland": 1.61,
-     "Philippines": 55.11,
-     "Qatar": 3.64,
-     "Singapure": 1.34,
-     "South Africa": 18.23,
-     "Sri Lanka": 365,
-     "Turkey": 19,
-     "United Arab Emirates": 3.7,
-     "England": 0.83,
-     "United States of America": 1,
-    }
-    return CURRENCY[country_name]
-
-def create_price_type(price_range):
-    # Criação do Tipo de Categoria de Comida
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-def color_name(color_code):
-    # Criação do nome das Cores
-    COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "orange",
-    "FFBA00": "red",
-    "CBCBC8": "darkred",
-    "FF7800": "darkred",
-    }
-    return COLORS[color_code]
-
-def rename_columns(dataframe):
-    # Renomear as colunas do DataFrame
-    df = dataframe.copy()
-    title = lambda x: inflection.titleize(x)
-    snakecase = lambda x: inflection.underscore(x)
-    spaces = lambda x: x.replace(" ", "")
-    cols_old = list(df.columns)
-    cols_old = list(map(title, cols_old))
-    cols_old = list(map(spaces, cols_old))
-    cols_new = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-def format_df(dataframe):
-    # Formatting df
-    df = rename_columns(dataframe)
-    # Removing NaN
-    df = df.loc[~df['cuisines'].isna(),:]
-    # Removing columns
-    df = df.drop(columns=['switch_to_order_menu'])
-    # Column price_range_type
-    df['price_range_type'] = df['price_range'].apply(lambda x: create_price_type(x) )
-    # Column country_name
-    df['country_name'] = df['country_code'].apply(lambda x: country_name(x))  
-    # Columns color_name
-    df['color_name'] = df['rating_color'].apply(lambda x: color_name(x) ) 
-    # Cuisines
-    df['cuisines'] = df.loc[:, 'cuisines'].apply(lambda x: x.split(",")[0])
-    # Changing types
-    df.loc[: , ['restaurant_id','country_code']] = df.loc[: , ['restaurant_id','country_code']].astype(str)    
-    # Dolar conversion
-    df['dolar_price'] = df[['average_cost_for_two','country_name']].apply(lambda x: x['average_cost_for_two'] / to_dolar(x['country_name']), axis=1).round(2)
-    df = df.loc[ df['dolar_price'] < 17006814.29 ]
-    # Reset index
-    df = df.reset_index(drop=True)
-    
-    return df
+
+from utils.data import load_dataset, cache_stats
+from utils.filters import filter_view
+from utils.cache import result_cache
+from utils.plan import Aggregation, execute, fold_top
+from utils.figures import dual_axis_chart, figure_cache
+from utils.trace import Trace, percentiles
+
+# Aggregates behind every chart of the page, answered together
+METRICS = {'restaurants': ('restaurant_id', 'nunique'), 'mean': ('aggregate_rating', 'mean'),
+           'rows': ('restaurant_id', 'size')}
+PLAN = [
+    Aggregation('home', [], METRICS),
+    Aggregation('country_rests', ['country_name'], METRICS),
+    Aggregation('city_rests', ['city'], METRICS),
+    Aggregation('cuisines', ['cuisines'], METRICS),
+]
+
+# Bars per chart; the rest is folded into an "Other" bar
+TOP_N = {'city_rests': 30, 'cuisines': 20}
 
 def streamlit_config():
     st.set_page_config(layout="wide", page_title="Zomato Restaurants")  
@@ -205,15 +116,26 @@ def sidebar_filters(df, country_multiselect):
     
     st.sidebar.markdown("""---""")
     st.sidebar.markdown('### Powered by Comunidade DS')
+
+    stats = cache_stats()
+    st.sidebar.caption('Dataset loaded from {} in {:.2f}s · cache hit rate {:.0%}'.format(stats['source'], stats['load_seconds'], stats['hit_rate']))
+    stats = result_cache.stats()
+    st.sidebar.caption('Result cache: {} hits · {} misses · {:.1f} MB'.format(stats['hits'], stats['misses'], stats['bytes'] / 2**20))
+    stats = figure_cache.stats()
+    st.sidebar.caption('Figure cache: {} hits · {} misses · {:.1f} MB'.format(stats['hits'], stats['misses'], stats['bytes'] / 2**20))
     
     # return country_multiselect, city_multiselect, price_range_multiselect, price_slider
     return city_multiselect, price_range_multiselect, price_slider, delivery, booking
 
 def filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking):
-    selected_lines = (df['price_range_type'].isin(price_range_multiselect)) & (df['country_name'].isin(country_multiselect)) & (df['city'].isin(city_multiselect)) & (df['average_cost_for_two'] <= price_slider) & (df['is_delivering_now'].isin(delivery)) & (df['has_table_booking'].isin(booking))
-    filtered_df = df.loc[ selected_lines , :]
+    filtered_df, key = filter_view(df, {'price_range_type': price_range_multiselect,
+                                      'country_name': country_multiselect,
+                                      'city': city_multiselect,
+                                      'is_delivering_now': delivery,
+                                      'has_table_booking': booking},
+                                     max_cost=price_slider)
     
-    return filtered_df
+    return filtered_df, key
 
 # def filter_df(price_range_multiselect, city_multiselect, price_slider):
 #     selected_lines = (df['price_range_type'].isin(price_range_multiselect)) & (df['city'].isin(city_multiselect)) & (df['average_cost_for_two'] <= price_slider)
@@ -221,105 +143,57 @@ def filter_df(price_range_multiselect, country_multiselect, city_multiselect, pr
     
 #     return filtered_df
 
-def country_rests(df):
+def country_rests(results):
     # Gráfico 1
     # 01. Gráfico Eixo X = Países / Eixo Y = #restaurantes e eixo secundário média de avaliacao
-    df_aux = df.loc[:,['country_name','restaurant_id','aggregate_rating']].groupby(['country_name']).agg({'restaurant_id': ['nunique'] , 'aggregate_rating':['mean']}).round(2)
-    df_aux.columns = ['restaurants','mean']
+    df_aux = results['country_rests'].round(2)
     df_aux = df_aux.reset_index().sort_values('restaurants', ascending=False)
 
-    # use specs parameter in make_subplots function
     st.markdown('### Restaurants by Country')
-    # to create secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-    # plot a scatter chart by specifying the x and y values
-    # Use add_trace function to specify secondary_y axes.
-    fig.add_trace(
-        go.Bar(x=df_aux['country_name'], y=df_aux['restaurants'], name="Restaurants by Country"),
-        secondary_y=False)
-
-    # Use add_trace function and specify secondary_y axes = True.
-    fig.add_trace(
-        go.Scatter(x=df_aux['country_name'], y=df_aux['mean'], name="Mean Rating"),
-        secondary_y=True)
-
-    # Naming y-axes
-    fig.update_yaxes(title_text=" Restaurants ", secondary_y=False)
-    fig.update_yaxes(title_text=" Rating ", secondary_y=True)
-    
-    return st.plotly_chart( fig, use_container_width=True )
+    with trace.stage('figure'):
+        fig = dual_axis_chart(df_aux, x='country_name', bar='restaurants', line='mean', bar_name="Restaurants by Country")
 
-def city_rests(df):
+    with trace.stage('plotly_chart'):
+        return st.plotly_chart( fig, use_container_width=True )
+
+def city_rests(results):
     # #################################
     # 02. Gráfico Eixo X = Cities / Eixo Y = #restaurantes e eixo secundário média de avaliacao
 
-    df_aux = df.loc[:,['city','restaurant_id','aggregate_rating']].groupby(['city']).agg({'restaurant_id': ['nunique'] , 'aggregate_rating':['mean']}).round(2)
-    df_aux.columns = ['restaurants','mean']
-    df_aux = df_aux.reset_index().sort_values('restaurants', ascending=False)
+    df_aux = fold_top(results['city_rests'], TOP_N['city_rests'], 'restaurants', weights={'mean': 'rows'})
+    df_aux = df_aux.round(2).reset_index()
 
     # Gráfico 02 - By City
 
-    # use specs parameter in make_subplots function
     st.markdown('### Restaurants by Cities')
-    # to create secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-    # plot a scatter chart by specifying the x and y values
-    # Use add_trace function to specify secondary_y axes.
-    fig.add_trace(
-        go.Bar(x=df_aux['city'], y=df_aux['restaurants'], name="Restaurants by City"),
-        secondary_y=False)
-
-    # Use add_trace function and specify secondary_y axes = True.
-    fig.add_trace(
-        go.Scatter(x=df_aux['city'], y=df_aux['mean'], name="Mean Rating"),
-        secondary_y=True)
-
-    # Naming y-axes
-    fig.update_yaxes(title_text=" Restaurants ", secondary_y=False)
-    fig.update_yaxes(title_text=" Rating ", secondary_y=True)
+    with trace.stage('figure'):
+        fig = dual_axis_chart(df_aux, x='city', bar='restaurants', line='mean', bar_name="Restaurants by City")
 
-    return st.plotly_chart( fig, use_container_width=True )    
+    with trace.stage('plotly_chart'):
+        return st.plotly_chart( fig, use_container_width=True )    
 
 
-def cuisines(df):
+def cuisines(results):
     # 03. Gráfico Eixo X = Cuisines / Eixo Y = #restaurantes e eixo secundário média de avaliacao
     # Gráfico 03 - By Cuisines
 
-    df_aux = df.loc[:,['cuisines','restaurant_id','aggregate_rating']].groupby(['cuisines']).agg({'restaurant_id': ['nunique'] , 'aggregate_rating':['mean']}).round(2)
-    df_aux.columns = ['restaurants','mean']
-    df_aux = df_aux.reset_index().sort_values('restaurants', ascending=False).head(20)
+    df_aux = fold_top(results['cuisines'], TOP_N['cuisines'], 'restaurants', weights={'mean': 'rows'})
+    df_aux = df_aux.round(2).reset_index()
 
-    # use specs parameter in make_subplots function
     st.markdown('### Most Popular Cuisines')
-    # to create secondary y-axis
-    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    with trace.stage('figure'):
+        fig = dual_axis_chart(df_aux, x='cuisines', bar='restaurants', line='mean', bar_name="Restaurants by Cuisines")
 
-    # plot a scatter chart by specifying the x and y values
-    # Use add_trace function to specify secondary_y axes.
-    fig.add_trace(
-        go.Bar(x=df_aux['cuisines'], y=df_aux['restaurants'], name="Restaurants by Cuisines"),
-        secondary_y=False)
+    with trace.stage('plotly_chart'):
+        return st.plotly_chart( fig, use_container_width=True )
 
-    # Use add_trace function and specify secondary_y axes = True.
-    fig.add_trace(
-        go.Scatter(x=df_aux['cuisines'], y=df_aux['mean'], name="Mean Rating"),
-        secondary_y=True)
-
-    # Naming y-axes
-    fig.update_yaxes(title_text=" Restaurants ", secondary_y=False)
-    fig.update_yaxes(title_text=" Rating ", secondary_y=True)
-
-    return st.plotly_chart( fig, use_container_width=True )
-
-def home(df):
+def home(results):
     st.markdown("<h1 style='text-align: center; color: grey;'>Overview</h1>", unsafe_allow_html=True)
     
-    restaurants_uniques = df['restaurant_id'].nunique()
-    country_unique = df['country_code'].nunique()
-    city_unique = df['city'].nunique()
-    avg_rating = round(df['aggregate_rating'].mean(),2)
+    restaurants_uniques = results['home']['restaurants'].iloc[0]
+    country_unique = len(results['country_rests'])
+    city_unique = len(results['city_rests'])
+    avg_rating = round(results['home']['mean'].iloc[0],2)
 
     col1, col2, col3, col4, col5, col6, col7, col8, col9, col10 = st.columns( 10 )
 
@@ -337,32 +211,69 @@ def home(df):
     
     return None
 
+def aggregates(trace, df, key):
+    # Results of PLAN, cached per filter state; on a miss the plan steps
+    # (cube, scan, distinct, rollup) are traced as nested stages
+    def compute():
+        results, timings = execute(PLAN, df, key)
+        for step, seconds in timings:
+            trace.add(step, seconds)
+        return results
+    return result_cache.get_or_compute(key + ('plan',), compute)
+
+def debug_panel(trace):
+    # Stage timings of this rerun and p50/p99 over the reruns of the process
+    record = trace.finish()
+    if not st.sidebar.checkbox('Show stage timings'):
+        return None
+
+    stages = pd.DataFrame(record['stages'], columns=['stage', 'depth', 'seconds', 'rows_in', 'rows_out', 'memory_mb'])
+    stages['stage'] = [ '· ' * depth + stage for stage, depth in zip(stages['stage'], stages['depth']) ]
+    stages['ms'] = (stages['seconds'] * 1000).round(1)
+    st.sidebar.caption('Rerun {:.1f} ms · memory {:+.1f} MB'.format(record['seconds'] * 1000, record['memory_mb']))
+    st.sidebar.dataframe( stages.loc[:, ['stage', 'ms', 'rows_in', 'rows_out', 'memory_mb']].round(2), hide_index=True )
+
+    history = pd.DataFrame(percentiles(trace.page), columns=['stage', 'reruns', 'p50', 'p99'])
+    history[['p50', 'p99']] = (history[['p50', 'p99']] * 1000).round(1)
+    st.sidebar.dataframe( history, hide_index=True )
+
+    return None
+
+
 #################
 ### StreamLit ###
 #################
 
 ## Streamlit Page
 streamlit_config()
+trace = Trace('Company')
 
 ## Dataframe
-df = format_df(dataframe)
+df = trace.call('load_dataset', load_dataset, trace=trace)
 
 # Sidebar Filters
-country_multiselect = country_filter(df)
+with trace.stage('sidebar_filters'):
+    country_multiselect = country_filter(df)
 
-city_multiselect, price_range_multiselect, price_slider, delivery, booking = sidebar_filters(df, country_multiselect)
+    city_multiselect, price_range_multiselect, price_slider, delivery, booking = sidebar_filters(df, country_multiselect)
 
 # Filtered DF
-df = filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking)
+df, key = trace.call('filter_df', filter_df, price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking, rows_in=len(df))
+
+# Aggregates
+results = trace.call('aggregates', aggregates, trace, df, key, rows_in=len(df))
 
 # Home
-home(df)
+trace.call('home', home, results)
 
 # Graph 01
-country_rests(df)
+trace.call('country_rests', country_rests, results, rows_in=len(results['country_rests']))
 
 # Graph 02
-city_rests(df)
+trace.call('city_rests', city_rests, results, rows_in=len(results['city_rests']))
 
 # Graph 03
-cuisines(df)
+trace.call('cuisines', cuisines, results, rows_in=len(results['cuisines']))
+
+# Debug
+debug_panel(trace)
@@ -1,121 +1,34 @@
+import numpy                as np
 import pandas               as pd
 import plotly.express       as px
 import streamlit            as st
 import plotly.graph_objects as go 
 
 from plotly.subplots import make_subplots
-import inflection
-
-dataframe = pd.read_csv('datasets/zomato.csv')
-
-
-# Preenchimento do nome dos países
-
-def country_name(country_id):
-    COUNTRIES = {
-    1: "India",
-    14: "Australia",
-    30: "Brazil",
-    37: "Canada",
-    94: "Indonesia",
-    148: "New Zeland",
-    162: "Philippines",
-    166: "Qatar",
-    184: "Singapure",
-    189: "South Africa",
-    191: "Sri Lanka",
-    208: "Turkey",
-    214: "United Arab Emirates",
-    215: "England",
-    216: "United States of America",
-    }
-    return COUNTRIES[country_id]
-
-def to_dolar(country_name):
-    # Conversão dólar
-    CURRENCY = {
-     "India": 83,
-     "Australia": 1.47,
-     "Brazil": 5.20,
-     "Canada": 1.36,
-     "Indonesia": 15.97,
-     "New Zeland": 1.61,
-     "Philippines": 55.11,
-     "Qatar": 3.64,
-     "Singapure": 1.34,
-     "South Africa": 18.23,
-     "Sri Lanka": 365,
-     "Turkey": 19,
-     "United Arab Emirates": 3.7,
-     "England": 0.83,
-     "United States of America": 1,
-    }
-    return CURRENCY[country_name]
-
-def create_price_type(price_range):
-    # Criação do Tipo de Categoria de Comida
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-def color_name(color_code):
-    # Criação do nome das Cores
-    COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "orange",
-    "FFBA00": "red",
-    "CBCBC8": "darkred",
-    "FF7800": "darkred",
-    }
-    return COLORS[color_code]
-
-def rename_columns(dataframe):
-    # Renomear as colunas do DataFrame
-    df = dataframe.copy()
-    title = lambda x: inflection.titleize(x)
-    snakecase = lambda x: inflection.underscore(x)
-    spaces = lambda x: x.replace(" ", "")
-    cols_old = list(df.columns)
-    cols_old = list(map(title, cols_old))
-    cols_old = list(map(spaces, cols_old))
-    cols_new = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-def format_df(dataframe):
-    # Formatting df
-    df = rename_columns(dataframe)
-    # Removing NaN
-    df = df.loc[~df['cuisines'].isna(),:]
-    # Removing columns
-    df = df.drop(columns=['switch_to_order_menu'])
-    # Column price_range_type
-    df['price_range_type'] = df['price_range'].apply(lambda x: create_price_type(x) )
-    # Column country_name
-    df['country_name'] = df['country_code'].apply(lambda x: country_name(x))  
-    # Columns color_name
-    df['color_name'] = df['rating_color'].apply(lambda x: color_name(x) ) 
-    # Cuisines
-    df['cuisines'] = df.loc[:, 'cuisines'].apply(lambda x: x.split(",")[0])
-    # Changing types
-    df.loc[: , ['restaurant_id','country_code']] = df.loc[: , ['restaurant_id','country_code']].astype(str)
-    # Dolar conversion
-    df['dolar_price'] = df[['average_cost_for_two','country_name']].apply(lambda x: x['average_cost_for_two'] / to_dolar(x['country_name']), axis=1).round(2)
-    df = df.loc[ df['dolar_price'] < 17006814.29 ]
-    # Convert boolean colums
-    df['has_delivery'] = df['has_online_delivery'].apply(lambda x: True if x == 1 else False)
-    df['has_booking'] = df['has_table_booking'].apply(lambda x: True if x == 1 else False)
-    # Reset index
-    df = df.reset_index(drop=True)
-    
-    return df
+
+from utils.data import load_dataset, cache_stats
+from utils.filters import filter_view
+from utils.cache import result_cache
+from utils.plan import Aggregation, execute, fold_top
+from utils.topk import top_k
+from utils.figures import dual_axis_chart, figure_cache
+from utils.trace import Trace, percentiles
+
+# Aggregates behind every chart of the page, answered together
+MEANS = {'aggregate_rating': ('aggregate_rating', 'mean'), 'average_cost_for_two': ('average_cost_for_two', 'mean')}
+PLAN = [
+    Aggregation('metrics', [], {'restaurants': ('restaurant_id', 'nunique'), 'mean': ('aggregate_rating', 'mean')}),
+    Aggregation('has_delivery', ['has_delivery'], MEANS),
+    Aggregation('has_booking', ['has_booking'], MEANS),
+    Aggregation('price_types', ['cuisines', 'price_range_type'], {'restaurant_id': ('restaurant_id', 'nunique')}),
+    Aggregation('cost_rating', ['cuisines'], dict(MEANS, restaurants=('restaurant_id', 'nunique'))),
+]
+
+# Cuisines shown in the price type distribution; the rest is folded into "Other"
+TOP_PRICE_CUISINES = 25
+
+# Cuisines highlighted (coloured and labelled) in the price vs rating scatter
+TOP_CUISINES = 10
 
 def streamlit_config():
     st.set_page_config(layout="wide", page_title="Zomato Restaurants")  
@@ -196,26 +109,45 @@ def sidebar_filters(df, country_multiselect):
     
     st.sidebar.markdown("""---""")
     st.sidebar.markdown('### Powered by Comunidade DS')
+
+    stats = cache_stats()
+    st.sidebar.caption('Dataset loaded from {} in {:.2f}s · cache hit rate {:.0%}'.format(stats['source'], stats['load_seconds'], stats['hit_rate']))
+    stats = result_cache.stats()
+    st.sidebar.caption('Result cache: {} hits · {} misses · {:.1f} MB'.format(stats['hits'], stats['misses'], stats['bytes'] / 2**20))
+    stats = figure_cache.stats()
+    st.sidebar.caption('Figure cache: {} hits · {} misses · {:.1f} MB'.format(stats['hits'], stats['misses'], stats['bytes'] / 2**20))
     
     return city_multiselect, price_range_multiselect, price_slider, delivery, booking
 
 def filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking):
-    selected_lines = (df['price_range_type'].isin(price_range_multiselect)) & (df['country_name'].isin(country_multiselect)) & (df['city'].isin(city_multiselect)) & (df['average_cost_for_two'] <= price_slider) & (df['has_delivery'].isin(delivery)) & (df['has_booking'].isin(booking))
-    filtered_df = df.loc[ selected_lines , :]
+    filtered_df, key = filter_view(df, {'price_range_type': price_range_multiselect,
+                                      'country_name': country_multiselect,
+                                      'city': city_multiselect,
+                                      'has_delivery': delivery,
+                                      'has_booking': booking},
+                                     max_cost=price_slider)
     
-    return filtered_df
+    return filtered_df, key
 
-def metrics(df):
+def metrics(df, key, results):
     st.markdown("<h1 style='text-align: center; color: grey;'>Restaurantes</h1>", unsafe_allow_html=True)
     
-    rests_uniques = df['restaurant_id'].nunique()
-    rest_uniques_rating = df[['aggregate_rating']].mean().round(2)[0]
-    
-    best_rest = df.loc[: , ['restaurant_name','aggregate_rating','votes'] ].sort_values(by=['aggregate_rating','votes'], ascending=[False,False] ).reset_index().loc[0,'restaurant_name']
-    best_rest_rate = df.loc[: , ['restaurant_name','aggregate_rating','votes'] ].sort_values(by=['aggregate_rating','votes'], ascending=[False,False] ).reset_index().loc[0,'aggregate_rating']
-    
-    worst_rest = df.loc[: , ['restaurant_name','aggregate_rating','votes'] ].sort_values(by=['aggregate_rating','votes'], ascending=[True,False] ).reset_index().loc[0,'restaurant_name']
-    worst_rest_rate = df.loc[: , ['restaurant_name','aggregate_rating','votes'] ].sort_values(by=['aggregate_rating','votes'], ascending=[True,False] ).reset_index().loc[0,'aggregate_rating']
+    def aggregate():
+        rests_uniques = results['metrics']['restaurants'].iloc[0]
+        rest_uniques_rating = round(results['metrics']['mean'].iloc[0],2)
+        
+        # only the columns the metrics read are gathered from the filtered view
+        rests = df.select(['restaurant_name','aggregate_rating','votes'])
+        best = top_k(rests, 1, by=['aggregate_rating','votes'], ascending=[False,False]).iloc[0]
+        best_rest = best['restaurant_name']
+        best_rest_rate = best['aggregate_rating']
+        
+        worst = top_k(rests, 1, by=['aggregate_rating','votes'], ascending=[True,False]).iloc[0]
+        worst_rest = worst['restaurant_name']
+        worst_rest_rate = worst['aggregate_rating']
+        return rests_uniques, rest_uniques_rating, best_rest, best_rest_rate, worst_rest, worst_rest_rate
+
+    rests_uniques, rest_uniques_rating, best_rest, best_rest_rate, worst_rest, worst_rest_rate = result_cache.get_or_compute(key + ('metrics',), aggregate)
     
     with st.container():
         col1, col2, col3 = st.columns( 3 )
@@ -243,7 +175,7 @@ def metrics(df):
     
     return None
 
-def first_container():
+def first_container(results):
     with st.container():
         col1, col2 = st.columns( 2 )
         
@@ -251,111 +183,144 @@ def first_container():
             # st.title('Has Delivery')
             st.markdown("<h1 style='text-align: center; color: black;'>Has Delivery</h1>", unsafe_allow_html=True)
             # Eixo 2o = Avaliação Média
-            df_aux = df.loc[:, ['has_delivery','aggregate_rating','average_cost_for_two' ]].groupby(['has_delivery']).mean().reset_index()
+            df_aux = results['has_delivery'].reset_index()
             df_aux['has_delivery'] = df_aux['has_delivery'].astype('string')
 
-            # use specs parameter in make_subplots function
-            # to create secondary y-axis
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-            # plot a scatter chart by specifying the x and y values
-            # Use add_trace function to specify secondary_y axes.
-            fig.add_trace(
-                go.Bar(x=df_aux['has_delivery'], y=df_aux['average_cost_for_two'], name="Averace Price"),
-                secondary_y=False)
-
-            # Use add_trace function and specify secondary_y axes = True.
-            fig.add_trace(
-                go.Scatter(x=df_aux['has_delivery'], y=df_aux['aggregate_rating'], name="Mean Rating"),
-                secondary_y=True)
-
-            # Naming y-axes
-            fig.update_yaxes(title_text=" Average Price ", secondary_y=False)
-            fig.update_yaxes(title_text=" Rating ", secondary_y=True)
+            with trace.stage('figure'):
+                fig = dual_axis_chart(df_aux, x='has_delivery', bar='average_cost_for_two', line='aggregate_rating',
+                                      bar_name="Averace Price", bar_title=" Average Price ")
             
-            st.plotly_chart( fig, use_container_width=True )
+            with trace.stage('plotly_chart'):
+                st.plotly_chart( fig, use_container_width=True )
             
             
         with col2:
             st.markdown("<h1 style='text-align: center; color: black;'>Has Booking</h1>", unsafe_allow_html=True)
-            df_aux = df.loc[:, ['has_booking','aggregate_rating','average_cost_for_two' ]].groupby(['has_booking']).mean().reset_index()
-            
+            df_aux = results['has_booking'].reset_index()
             df_aux['has_booking'] = df_aux['has_booking'].astype('string')
 
-            # use specs parameter in make_subplots function
-            # to create secondary y-axis
-            fig = make_subplots(specs=[[{"secondary_y": True}]])
-
-            # plot a scatter chart by specifying the x and y values
-            # Use add_trace function to specify secondary_y axes.
-            fig.add_trace(
-                go.Bar(x=df_aux['has_booking'], y=df_aux['average_cost_for_two'], name="Averace Price"),
-                secondary_y=False)
-
-            # Use add_trace function and specify secondary_y axes = True.
-            fig.add_trace(
-                go.Scatter(x=df_aux['has_booking'], y=df_aux['aggregate_rating'], name="Mean Rating"),
-                secondary_y=True)
-
-            # Naming y-axes
-            fig.update_yaxes(title_text=" Average Price ", secondary_y=False)
-            fig.update_yaxes(title_text=" Rating ", secondary_y=True)
-
-            st.plotly_chart( fig, use_container_width=True )
+            with trace.stage('figure'):
+                fig = dual_axis_chart(df_aux, x='has_booking', bar='average_cost_for_two', line='aggregate_rating',
+                                      bar_name="Averace Price", bar_title=" Average Price ")
+            
+            with trace.stage('plotly_chart'):
+                st.plotly_chart( fig, use_container_width=True )
 
     return None
 
-def second_container():
+def second_container(results):
     # st.title('Price type distribution by Cuisines')
     st.markdown("<h1 style='text-align: center; color: black;'>Price type distribution by Cuisines</h1>", unsafe_allow_html=True)
-    x = df.loc[:,['cuisines', 'price_range_type', 'restaurant_id']].groupby(['cuisines','price_range_type']).nunique().sort_values(by='restaurant_id', ascending=False).reset_index()
-    fig = px.bar(x, x="cuisines", y="restaurant_id", color="price_range_type")
+    x = fold_top(results['price_types'], TOP_PRICE_CUISINES, 'restaurant_id').reset_index()
+    with trace.stage('figure'):
+        fig = px.bar(x, x="cuisines", y="restaurant_id", color="price_range_type")
     
-    st.plotly_chart( fig, use_container_width=True )
+    with trace.stage('plotly_chart'):
+        st.plotly_chart( fig, use_container_width=True )
     
     return None
 
-def third_container(df):
+def cuisine_scatter(aux, top_n):
+    # One WebGL trace for every cuisine, coloured by an index array: the
+    # top_n cuisines by restaurants get a colour and a label, the rest grey
+    top = aux.sort_values('restaurants', ascending=False, kind='stable').head(top_n)
+    rank = pd.Series(np.arange(len(top)), index=top.index).reindex(aux.index).fillna(len(top))
+
+    palette = [px.colors.qualitative.Plotly[i % 10] for i in range(len(top))] + ['lightgrey']
+    colorscale = []
+    for i, color in enumerate(palette):
+        colorscale += [[i / len(palette), color], [(i + 1) / len(palette), color]]
+
+    fig = go.Figure(go.Scattergl(x=aux['average_cost_for_two'], y=aux['aggregate_rating'],
+                                 mode='markers+text',
+                                 text=aux['cuisines'].astype(str).where(rank < len(top), ''),
+                                 textposition='top center',
+                                 hovertext=aux['cuisines'].astype(str),
+                                 hovertemplate='%{hovertext}<br>average_cost_for_two=%{x}<br>aggregate_rating=%{y}<extra></extra>',
+                                 marker={'color': rank, 'colorscale': colorscale,
+                                         'cmin': -0.5, 'cmax': len(palette) - 0.5,
+                                         'size': np.where(rank < len(top), 12, 7)}))
+    fig.update_xaxes(title_text='average_cost_for_two')
+    fig.update_yaxes(title_text='aggregate_rating')
+    return fig
+
+def third_container(results):
     st.markdown("<h1 style='text-align: center; color: black;'>Do the most expensive restaurants get the best ratings? </h1>", unsafe_allow_html=True)
-    aux = df.loc[ : , ['cuisines', 'average_cost_for_two', 'aggregate_rating'] ].groupby(['cuisines']).agg({'average_cost_for_two': 'mean' , 'aggregate_rating': 'mean'}).round(2)
-
-    aux.columns = ['average_cost_for_two','aggregate_rating']
-    aux = aux.reset_index()
+    aux = results['cost_rating'].round(2).reset_index()
     # aux = aux.loc[ aux['average_cost_for_two'] < 500 , : ]
 
-    fig = px.scatter(aux, x='average_cost_for_two', y='aggregate_rating', color='cuisines')
+    with trace.stage('figure'):
+        fig = cuisine_scatter(aux, TOP_CUISINES)
 
-    st.plotly_chart( fig, use_container_width=True )
+    with trace.stage('plotly_chart'):
+        st.plotly_chart( fig, use_container_width=True )
     
     return None
 
 
+def aggregates(trace, df, key):
+    # Results of PLAN, cached per filter state; on a miss the plan steps
+    # (cube, scan, distinct, rollup) are traced as nested stages
+    def compute():
+        results, timings = execute(PLAN, df, key)
+        for step, seconds in timings:
+            trace.add(step, seconds)
+        return results
+    return result_cache.get_or_compute(key + ('plan',), compute)
+
+def debug_panel(trace):
+    # Stage timings of this rerun and p50/p99 over the reruns of the process
+    record = trace.finish()
+    if not st.sidebar.checkbox('Show stage timings'):
+        return None
+
+    stages = pd.DataFrame(record['stages'], columns=['stage', 'depth', 'seconds', 'rows_in', 'rows_out', 'memory_mb'])
+    stages['stage'] = [ '· ' * depth + stage for stage, depth in zip(stages['stage'], stages['depth']) ]
+    stages['ms'] = (stages['seconds'] * 1000).round(1)
+    st.sidebar.caption('Rerun {:.1f} ms · memory {:+.1f} MB'.format(record['seconds'] * 1000, record['memory_mb']))
+    st.sidebar.dataframe( stages.loc[:, ['stage', 'ms', 'rows_in', 'rows_out', 'memory_mb']].round(2), hide_index=True )
+
+    history = pd.DataFrame(percentiles(trace.page), columns=['stage', 'reruns', 'p50', 'p99'])
+    history[['p50', 'p99']] = (history[['p50', 'p99']] * 1000).round(1)
+    st.sidebar.dataframe( history, hide_index=True )
+
+    return None
+
+
 #################
 ### StreamLit ###
 #################
 
 ## Streamlit Page
 streamlit_config()
+trace = Trace('Restaurants')
 
 ## Dataframe
-df = format_df(dataframe)
+df = trace.call('load_dataset', load_dataset, trace=trace)
 
 # Sidebar Filters
-country_multiselect = country_filter(df)
+with trace.stage('sidebar_filters'):
+    country_multiselect = country_filter(df)
 
-city_multiselect, price_range_multiselect, price_slider, delivery, booking = sidebar_filters(df, country_multiselect)
+    city_multiselect, price_range_multiselect, price_slider, delivery, booking = sidebar_filters(df, country_multiselect)
 
 # Filtered DF
-df = filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking)
+df, key = trace.call('filter_df', filter_df, price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking, rows_in=len(df))
+
+# Aggregates
+results = trace.call('aggregates', aggregates, trace, df, key, rows_in=len(df))
 
 # Home
-metrics(df)
+trace.call('metrics', metrics, df, key, results, rows_in=len(df))
 
 # Graph 01
-first_container()
+trace.call('first_container', first_container, results)
 
 # Graph 02
-second_container()
+trace.call('second_container', second_container, results, rows_in=len(results['price_types']))
 
 # Graph 03
-third_container(df)
+trace.call('third_container', third_container, results, rows_in=len(results['cost_rating']))
+
+# Debug
+debug_panel(trace)
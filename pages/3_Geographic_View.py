@@ -4,118 +4,19 @@ import streamlit            as st
 import plotly.graph_objects as go 
 
 from plotly.subplots import make_subplots
-import inflection
-
-dataframe = pd.read_csv('datasets/zomato.csv')
-
-
-# Preenchimento do nome dos países
-
-def country_name(country_id):
-    COUNTRIES = {
-    1: "India",
-    14: "Australia",
-    30: "Brazil",
-    37: "Canada",
-    94: "Indonesia",
-    148: "New Zeland",
-    162: "Philippines",
-    166: "Qatar",
-    184: "Singapure",
-    189: "South Africa",
-    191: "Sri Lanka",
-    208: "Turkey",
-    214: "United Arab Emirates",
-    215: "England",
-    216: "United States of America",
-    }
-    return COUNTRIES[country_id]
-
-def to_dolar(country_name):
-    # Conversão dólar
-    CURRENCY = {
-     "India": 83,
-     "Australia": 1.47,
-     "Brazil": 5.20,
-     "Canada": 1.36,
-     "Indonesia": 15.97,
-     "New Zeland": 1.61,
-     "Philippines": 55.11,
-     "Qatar": 3.64,
-     "Singapure": 1.34,
-     "South Africa": 18.23,
-     "Sri Lanka": 365,
-     "Turkey": 19,
-     "United Arab Emirates": 3.7,
-     "England": 0.83,
-     "United States of America": 1,
-    }
-    return CURRENCY[country_name]
-
-def create_price_type(price_range):
-    # Criação do Tipo de Categoria de Comida
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-def color_name(color_code):
-    # Criação do nome das Cores
-    COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "orange",
-    "FFBA00": "red",
-    "CBCBC8": "darkred",
-    "FF7800": "darkred",
-    }
-    return COLORS[color_code]
-
-def rename_columns(dataframe):
-    # Renomear as colunas do DataFrame
-    df = dataframe.copy()
-    title = lambda x: inflection.titleize(x)
-    snakecase = lambda x: inflection.underscore(x)
-    spaces = lambda x: x.replace(" ", "")
-    cols_old = list(df.columns)
-    cols_old = list(map(title, cols_old))
-    cols_old = list(map(spaces, cols_old))
-    cols_new = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-def format_df(dataframe):
-    # Formatting df
-    df = rename_columns(dataframe)
-    # Removing NaN
-    df = df.loc[~df['cuisines'].isna(),:]
-    # Removing columns
-    df = df.drop(columns=['switch_to_order_menu'])
-    # Column price_range_type
-    df['price_range_type'] = df['price_range'].apply(lambda x: create_price_type(x) )
-    # Column country_name
-    df['country_name'] = df['country_code'].apply(lambda x: country_name(x))  
-    # Columns color_name
-    df['color_name'] = df['rating_color'].apply(lambda x: color_name(x) ) 
-    # Cuisines
-    df['cuisines'] = df.loc[:, 'cuisines'].apply(lambda x: x.split(",")[0])
-    # Changing types
-    df.loc[: , ['restaurant_id','country_code']] = df.loc[: , ['restaurant_id','country_code']].astype(str)
-    # Dolar conversion
-    df['dolar_price'] = df[['average_cost_for_two','country_name']].apply(lambda x: x['average_cost_for_two'] / to_dolar(x['country_name']), axis=1).round(2)
-    df = df.loc[ df['dolar_price'] < 17006814.29 ]
-    # Convert boolean colums
-    df['has_delivery'] = df['has_online_delivery'].apply(lambda x: True if x == 1 else False)
-    df['has_booking'] = df['has_table_booking'].apply(lambda x: True if x == 1 else False)
-    # Reset index
-    df = df.reset_index(drop=True)
-    
-    return df
+
+from utils.data import load_dataset, cache_stats
+from utils.filters import FilteredView, filter_view
+from utils.cache import result_cache
+from utils.figures import typed_arrays
+from utils.geo import (POINTS_ZOOM, WORLD_BOX, WORLD_CENTER, cluster_points, nearest_restaurants, get_spatial_index,
+                       viewport, outside_counts, cell_size, density_grid, density_level,
+                       grid_geojson, in_lon_range)
+from utils.trace import Trace, percentiles
+
+# Columns this page reads; the map gathers only these from the shared frame
+COLUMNS = ['restaurant_name', 'country_name', 'city', 'latitude', 'longitude', 'cuisines',
+           'aggregate_rating', 'average_cost_for_two', 'dolar_price', 'price_range_type', 'has_delivery', 'has_booking']
 
 def streamlit_config():
     st.set_page_config(layout="wide", page_title="Zomato Restaurants")  
@@ -201,56 +102,224 @@ def sidebar_filters(df, country_multiselect):
     columns =  st.sidebar.radio(
     "Map - Identify by:",
     ('cuisines', 'has_booking', 'has_delivery', 'price_range_type'))
+
+    zoom = st.sidebar.slider(
+            'Map zoom:',
+            value     = 1,
+            min_value = 1,
+            max_value = 18)
+
+    map_center = st.sidebar.selectbox(
+                    'Center the map on:',
+                    options = ['All filtered restaurants'] + list(cities_list))
+
+    map_mode = st.sidebar.radio(
+    "Map mode:",
+    ('All restaurants', 'Density', 'Near me'))
+
+    if map_mode == 'Near me':
+        near_lat = st.sidebar.number_input('My latitude:', value=28.6139, min_value=-90.0, max_value=90.0, format='%.4f')
+        near_lon = st.sidebar.number_input('My longitude:', value=77.2090, min_value=-180.0, max_value=180.0, format='%.4f')
+        near_km = st.sidebar.slider('Within (km):', value=5, min_value=1, max_value=100)
+        near_k = st.sidebar.slider('How many restaurants:', value=10, min_value=1, max_value=100)
+        near_me = (near_lat, near_lon, near_km, near_k)
+    else:
+        near_me = None
     
     st.sidebar.markdown("""---""")
     st.sidebar.markdown('### Powered by Comunidade DS')
+
+    stats = cache_stats()
+    st.sidebar.caption('Dataset loaded from {} in {:.2f}s · cache hit rate {:.0%}'.format(stats['source'], stats['load_seconds'], stats['hit_rate']))
     
     # return country_multiselect, city_multiselect, price_range_multiselect, price_slider
-    return city_multiselect, price_range_multiselect, price_slider, delivery, booking, columns
+    return city_multiselect, price_range_multiselect, price_slider, delivery, booking, columns, zoom, map_center, map_mode, near_me
 
 def filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking):
-    selected_lines = (df['price_range_type'].isin(price_range_multiselect)) & (df['country_name'].isin(country_multiselect)) & (df['city'].isin(city_multiselect)) & (df['average_cost_for_two'] <= price_slider) & (df['has_delivery'].isin(delivery)) & (df['has_booking'].isin(booking))
-    filtered_df = df.loc[ selected_lines , :]
+    filtered_df, key = filter_view(df, {'price_range_type': price_range_multiselect,
+                                      'country_name': country_multiselect,
+                                      'city': city_multiselect,
+                                      'has_delivery': delivery,
+                                      'has_booking': booking},
+                                     max_cost=price_slider)
     
-    return filtered_df
+    return filtered_df, key
+
+def map_view(df):
+    # Centre of the map and the box it shows (plus a margin); the whole
+    # world when the filter left no rows
+    if len(df) == 0:
+        return dict(WORLD_CENTER), WORLD_BOX
+    if map_center == 'All filtered restaurants':
+        center = {'lat': df['latitude'].mean(), 'lon': df['longitude'].mean()}
+    else:
+        city = dataset.loc[dataset['city'] == map_center, ['latitude', 'longitude']].median()
+        center = {'lat': city['latitude'], 'lon': city['longitude']}
+
+    box = viewport(center['lat'], center['lon'], zoom)
+    return center, box
 
-def first_container(df):
+def first_container(df, key):
     st.markdown("<h1 style='text-align: center; color: grey;'>Restaurants World Map</h1>", unsafe_allow_html=True)
 
-    fig = px.scatter_mapbox( df,
-                      lat='latitude',
-                      lon='longitude',
-                      color=columns,
-                      size='average_cost_for_two',
-                      hover_name='restaurant_name',
-                      zoom=1
-                     )
-    fig.update_layout(mapbox_style='open-street-map')
-    fig.update_layout(margin={'r':0, 'l':0, 't':0, 'b':0})
-    st.plotly_chart( fig, use_container_width=True )
+    # Only the rows in view are sent; the rest as counts per direction
+    center, box = map_view(df)
+    visible = FilteredView(dataset, get_spatial_index(dataset).in_box(box, rows=df.rows)).select(COLUMNS)
+
+    with trace.stage('figure'):
+        if zoom >= POINTS_ZOOM:
+            fig = px.scatter_mapbox( visible,
+                              lat='latitude',
+                              lon='longitude',
+                              color=columns,
+                              size='average_cost_for_two',
+                              hover_name='restaurant_name',
+                              center=center,
+                              zoom=zoom
+                             )
+        else:
+            # Clusters sized by restaurant count, coloured by the dominant identifier
+            with trace.stage('clusters'):
+                clusters = result_cache.get_or_compute(key + ('clusters', zoom, columns, box),
+                                                       lambda: cluster_points(visible, zoom, columns))
+            fig = px.scatter_mapbox( clusters,
+                              lat='latitude',
+                              lon='longitude',
+                              color=columns,
+                              size='count',
+                              hover_data=['count', 'mean_rating', 'share'],
+                              center=center,
+                              zoom=zoom
+                             )
+
+        outside = outside_counts(df, box)
+        if len(outside) > 0:
+            fig.add_trace(go.Scattermapbox(lat=outside['latitude'], lon=outside['longitude'], mode='markers+text',
+                                           text=outside['direction'] + ' ' + outside['count'].astype(str),
+                                           textposition='middle right', name='Outside the view',
+                                           marker={'size': 12, 'color': 'grey'}))
+        fig.update_layout(mapbox_style='open-street-map')
+        fig.update_layout(margin={'r':0, 'l':0, 't':0, 'b':0})
+    with trace.stage('plotly_chart'):
+        st.plotly_chart( typed_arrays(fig), use_container_width=True )
     st.text('Choose the identifier on the left side filters')    
 
     return None
 
 
+def density_container(df, key):
+    st.markdown("<h1 style='text-align: center; color: grey;'>Restaurants Density</h1>", unsafe_allow_html=True)
+
+    heat_by = st.radio('Heat by:', ('Restaurants', 'Mean rating'), horizontal=True)
+
+    # Grid pyramid of the filter state, then the level that fits the zoom, cut to the view
+    grids = result_cache.get_or_compute(key + ('density',), lambda: density_grid(df))
+    level = density_level(zoom)
+    center, box = map_view(df)
+    south, north, west, east = box
+    cells = grids[level]
+    cells = cells.loc[ (cells['latitude'] >= south - level) & (cells['latitude'] <= north + level) &
+                       in_lon_range(cells['longitude'].to_numpy(), west - level, east + level) ]
+
+    customdata = cells[['count', 'mean_rating']]
+    hovertemplate = '%{customdata[0]} restaurants<br>mean rating %{customdata[1]}<extra></extra>'
+    with trace.stage('figure'):
+        if heat_by == 'Restaurants':
+            # radius of about one cell on screen
+            radius = min(max(level / cell_size(zoom) * 60, 8), 60)
+            fig = go.Figure(go.Densitymapbox(lat=cells['latitude'], lon=cells['longitude'], z=cells['count'], radius=radius,
+                                             customdata=customdata, hovertemplate=hovertemplate))
+        else:
+            # a density layer sums z over neighbouring cells; the mean rating is
+            # drawn as the grid cells themselves, each coloured by its own mean
+            fig = go.Figure(go.Choroplethmapbox(geojson=grid_geojson(cells, level), locations=[str(i) for i in range(len(cells))],
+                                                z=cells['mean_rating'], zmin=0, zmax=5, colorscale='RdYlGn',
+                                                marker={'opacity': 0.6, 'line': {'width': 0}},
+                                                customdata=customdata, hovertemplate=hovertemplate))
+        fig.update_layout(mapbox_style='open-street-map', mapbox_center=center, mapbox_zoom=zoom)
+        fig.update_layout(margin={'r':0, 'l':0, 't':0, 'b':0})
+    with trace.stage('plotly_chart'):
+        st.plotly_chart( typed_arrays(fig), use_container_width=True )
+
+    return None
+
+
+def near_me_container(rows):
+    st.markdown("<h1 style='text-align: center; color: grey;'>Restaurants Near Me</h1>", unsafe_allow_html=True)
+
+    lat, lon, radius_km, k = near_me
+    # rows of the shared frame kept by the filters
+    near = nearest_restaurants(dataset, lat, lon, k, rows=rows, max_km=radius_km)
+
+    with trace.stage('figure'):
+        fig = px.scatter_mapbox( near,
+                          lat='latitude',
+                          lon='longitude',
+                          color=columns,
+                          hover_name='restaurant_name',
+                          hover_data=['aggregate_rating', 'distance_km'],
+                          center={'lat': lat, 'lon': lon},
+                          zoom=zoom
+                         )
+        fig.add_trace(go.Scattermapbox(lat=[lat], lon=[lon], name='Me', marker={'size': 14, 'color': 'black'}))
+        fig.update_layout(mapbox_style='open-street-map')
+        fig.update_layout(margin={'r':0, 'l':0, 't':0, 'b':0})
+    with trace.stage('plotly_chart'):
+        st.plotly_chart( typed_arrays(fig), use_container_width=True )
+
+    st.dataframe( near.loc[:, ['restaurant_name', 'city', 'cuisines', 'aggregate_rating', 'average_cost_for_two', 'distance_km']].reset_index(drop=True), use_container_width=True )
+
+    return None
+
+
+def debug_panel(trace):
+    # Stage timings of this rerun and p50/p99 over the reruns of the process
+    record = trace.finish()
+    if not st.sidebar.checkbox('Show stage timings'):
+        return None
+
+    stages = pd.DataFrame(record['stages'], columns=['stage', 'depth', 'seconds', 'rows_in', 'rows_out', 'memory_mb'])
+    stages['stage'] = [ '· ' * depth + stage for stage, depth in zip(stages['stage'], stages['depth']) ]
+    stages['ms'] = (stages['seconds'] * 1000).round(1)
+    st.sidebar.caption('Rerun {:.1f} ms · memory {:+.1f} MB'.format(record['seconds'] * 1000, record['memory_mb']))
+    st.sidebar.dataframe( stages.loc[:, ['stage', 'ms', 'rows_in', 'rows_out', 'memory_mb']].round(2), hide_index=True )
+
+    history = pd.DataFrame(percentiles(trace.page), columns=['stage', 'reruns', 'p50', 'p99'])
+    history[['p50', 'p99']] = (history[['p50', 'p99']] * 1000).round(1)
+    st.sidebar.dataframe( history, hide_index=True )
+
+    return None
+
+
 #################
 ### StreamLit ###
 #################
 
 ## Streamlit Page
 streamlit_config()
+trace = Trace('Geographic View')
 
 ## Dataframe
-df = format_df(dataframe)
+df = trace.call('load_dataset', load_dataset, trace=trace)
+dataset = df
 
 # Sidebar Filters
-country_multiselect = country_filter(df)
+with trace.stage('sidebar_filters'):
+    country_multiselect = country_filter(df)
 
-city_multiselect, price_range_multiselect, price_slider, delivery, booking, columns = sidebar_filters(df, country_multiselect)
+    city_multiselect, price_range_multiselect, price_slider, delivery, booking, columns, zoom, map_center, map_mode, near_me = sidebar_filters(df, country_multiselect)
 
 # Filtered DF
-df = filter_df(price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking)
+df, key = trace.call('filter_df', filter_df, price_range_multiselect, country_multiselect, city_multiselect, price_slider, delivery, booking, rows_in=len(df))
 
 # Graph 01
-first_container(df)
+if map_mode == 'Density':
+    trace.call('density_container', density_container, df, key, rows_in=len(df))
+elif map_mode == 'Near me':
+    trace.call('near_me_container', near_me_container, df.rows, rows_in=len(df))
+else:
+    trace.call('first_container', first_container, df, key, rows_in=len(df))
+
+# Debug
+debug_panel(trace)
 
@@ -0,0 +1,101 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from utils.cache import LRUCache
+from utils.figures import FigureCache
+
+
+def test_evicts_least_recently_used_over_the_byte_budget():
+    cache = LRUCache(100)
+    cache.put('a', 'A', size=40)
+    cache.put('b', 'B', size=40)
+    assert cache.get('a') == 'A'  # 'a' is now the most recent
+    cache.put('c', 'C', size=40)
+
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.bytes == 80
+    assert cache.evictions == 1
+
+def test_replacing_a_key_updates_its_size():
+    cache = LRUCache(100)
+    cache.put('a', 'A', size=60)
+    cache.put('a', 'A2', size=30)
+    cache.put('b', 'B', size=70)
+    assert cache.bytes == 100
+    assert cache.get('a') == 'A2'
+    assert cache.evictions == 0
+
+def test_values_over_the_budget_are_not_stored():
+    cache = LRUCache(100)
+    cache.put('a', 'A', size=50)
+    assert cache.put('big', 'B', size=101) == 'B'
+    assert list(cache.entries) == ['a']
+    assert cache.bytes == 50
+
+def test_counters():
+    cache = LRUCache(1000)
+    calls = []
+    compute = lambda: calls.append(1) or np.arange(10)
+    for _ in range(3):
+        cache.get_or_compute('a', compute)
+    cache.get('missing')
+
+    stats = cache.stats()
+    assert len(calls) == 1
+    assert (stats['hits'], stats['misses'], stats['entries']) == (2, 2, 1)
+    assert stats['hit_rate'] == 0.5
+    assert stats['bytes'] == np.arange(10).nbytes
+
+def test_concurrent_get_or_compute():
+    # sessions missing and hitting overlapping keys while the budget keeps
+    # evicting: every call gets its own key's value, counters and bytes add up
+    cache = LRUCache(20 * 8 * 100)
+    errors = []
+
+    def session(seed):
+        rng = np.random.default_rng(seed)
+        for _ in range(500):
+            key = int(rng.integers(40))
+            value = cache.get_or_compute(key, lambda: np.full(100, key))
+            if value[0] != key:
+                errors.append((key, value[0]))
+
+    threads = [threading.Thread(target=session, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.hits + cache.misses == 8 * 500
+    assert cache.bytes == sum(size for _, size in cache.entries.values()) <= cache.max_bytes
+    assert len(cache.entries) == 20
+
+def build(frame):
+    return lambda: go.Figure(go.Bar(x=frame['x'], y=frame['y']))
+
+def test_figure_cache_reuses_figures_of_equal_data():
+    cache = FigureCache(10 * 2**20)
+    frame = pd.DataFrame({'x': list('abc'), 'y': [1, 2, 3]})
+    fig = cache.get_or_build(('bar',), frame, build(frame))
+
+    assert cache.get_or_build(('bar',), frame.copy(), build(frame)) is fig
+    assert cache.get_or_build(('bar', 'other spec'), frame, build(frame)) is not fig
+    changed = frame.assign(y=[1, 2, 4])
+    assert cache.get_or_build(('bar',), changed, build(changed)) is not fig
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_figure_cache_sizes_by_json_and_evicts():
+    frame = pd.DataFrame({'x': list('abc'), 'y': [1, 2, 3]})
+    size = len(pio.to_json(build(frame)(), validate=False))
+    cache = FigureCache(2 * size)
+    for y in range(3):
+        data = frame.assign(y=[y] * 3)
+        cache.get_or_build(('bar',), data, build(data))
+
+    assert cache.bytes == 2 * size
+    assert cache.evictions == 1
@@ -0,0 +1,38 @@
+import warnings
+
+import pandas as pd
+
+from benchmarks.format_df import assert_same_values, format_df_rowwise, scale_frame
+from utils.data import CATEGORY_COLUMNS, DATASET_PATH, category_savings, format_df
+
+
+def reference(raw):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        return format_df_rowwise(raw)
+
+def test_format_df_matches_the_rowwise_reference():
+    raw = pd.read_csv(DATASET_PATH)
+    assert_same_values(format_df(raw), reference(raw))
+
+def test_format_df_matches_on_repeated_rows():
+    # a shuffled copy twice the size, so the per-distinct-value work sees
+    # the values in another order
+    raw = scale_frame(pd.read_csv(DATASET_PATH), 15000).sample(frac=1, random_state=0).reset_index(drop=True)
+    assert_same_values(format_df(raw), reference(raw))
+
+def test_restaurant_id_stays_an_integer_with_the_same_counts():
+    # the original cast restaurant_id to str; every reader counts it
+    # distinct, which must not change
+    raw = pd.read_csv(DATASET_PATH)
+    df, original = format_df(raw), reference(raw)
+    assert pd.api.types.is_integer_dtype(df['restaurant_id'])
+    for keys in (['country_name'], ['city'], ['cuisines', 'price_range_type']):
+        counts = df.groupby(keys, observed=True)['restaurant_id'].nunique()
+        expected = original.groupby(keys)['restaurant_id'].nunique()
+        assert counts.to_dict() == expected.to_dict()
+
+def test_every_category_column_shrinks_the_frame():
+    savings = category_savings(format_df(pd.read_csv(DATASET_PATH)))
+    assert list(savings.index) == CATEGORY_COLUMNS
+    assert (savings['ratio'] < 1).all(), savings
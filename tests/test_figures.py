@@ -0,0 +1,40 @@
+import base64
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+from utils import figures
+from utils.figures import TypedArrayFigure
+
+
+def decode(value):
+    # A typed array of the payload back to numpy, as plotly.js reads it
+    array = np.frombuffer(base64.b64decode(value['bdata']), dtype=np.dtype(value['dtype']))
+    if 'shape' in value:
+        array = array.reshape([int(n) for n in value['shape'].split(',')])
+    return array
+
+def test_hover_values_round_trip_through_typed_arrays():
+    n = 50
+    clusters = pd.DataFrame({'latitude': np.linspace(-30, 30, n), 'longitude': np.linspace(-60, 60, n),
+                             'count': np.arange(1, n + 1), 'mean_rating': np.full(n, 4.35),
+                             'share': np.linspace(0.01, 0.99, n).round(2)})
+    fig = px.scatter_mapbox(clusters, lat='latitude', lon='longitude', size='count',
+                            hover_data=['count', 'mean_rating', 'share'])
+    fig.__class__ = TypedArrayFigure
+    trace = json.loads(pio.to_json(fig, validate=False))['data'][0]
+
+    customdata = decode(trace['customdata'])
+    assert trace['customdata']['dtype'] == 'f8'
+    assert customdata[:, 1].tolist() == clusters['mean_rating'].tolist()
+    assert customdata[:, 2].tolist() == clusters['share'].tolist()
+    # coordinates are the only floats sent short
+    assert trace['lat']['dtype'] == 'f4'
+    assert np.allclose(decode(trace['lat']), clusters['latitude'], atol=1e-5)
+
+def test_short_arrays_stay_lists():
+    encoded = figures.encode_arrays({'lat': [1.5, 2.5], 'customdata': [[4.35]]})
+    assert encoded == {'lat': [1.5, 2.5], 'customdata': [[4.35]]}
@@ -0,0 +1,53 @@
+import gc
+import threading
+
+import pandas as pd
+import pytest
+
+from utils import filters
+from utils.filters import get_filter_index, index_for_key
+
+
+def frame(n):
+    return pd.DataFrame({'country_name': ['India', 'Brazil'] * n, 'city': ['Goa', 'Rio'] * n,
+                         'average_cost_for_two': range(2 * n)})
+
+def test_index_is_dropped_with_its_frame():
+    df = frame(10)
+    token = get_filter_index(df).token
+    assert index_for_key((token,)).n_rows == 20
+
+    del df
+    gc.collect()
+    with pytest.raises(KeyError):
+        index_for_key((token,))
+
+def test_lookups_while_frames_are_collected():
+    # index_for_key iterates the indexes while other threads add entries and
+    # drop them through the weak reference callback
+    keep = frame(5)
+    token = get_filter_index(keep).token
+    errors = []
+
+    def churn():
+        for _ in range(200):
+            get_filter_index(frame(5))
+
+    def lookup():
+        try:
+            for _ in range(2000):
+                index_for_key((token,))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=churn) for _ in range(2)] + [threading.Thread(target=lookup) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    gc.collect()
+
+    assert errors == []
+    # only live frames are left
+    assert all(ref() is not None for ref, _ in filters._indexes.values())
+    assert index_for_key((token,)) is get_filter_index(keep)
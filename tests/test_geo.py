@@ -0,0 +1,20 @@
+import numpy as np
+
+from utils.data import load_dataset
+from utils.geo import get_spatial_index, in_lon_range
+
+
+def test_in_lon_range_wraps_over_the_antimeridian():
+    lon = np.array([-179.0, -171.0, -169.0, 0.0, 169.0, 171.0, 179.0])
+    assert in_lon_range(lon, 170, -170).tolist() == [True, True, False, False, False, True, True]
+    assert in_lon_range(lon, 170, 190).tolist() == [True, True, False, False, False, True, True]
+    assert in_lon_range(lon, -180, 180).all()
+
+def test_in_box_wrapped_box_matches_a_scan():
+    df = load_dataset()
+    lon = df['longitude'].to_numpy(dtype=float)
+    expected = np.flatnonzero((lon >= 170) | (lon <= -170))
+    assert len(expected) > 0
+
+    rows = get_spatial_index(df).in_box((-90, 90, 170, -170))
+    assert rows.tolist() == expected.tolist()
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from benchmarks.format_df import assert_same_values
+from utils.data import format_df
+from utils.ingest import ZIP_PATH, aggregate_chunks, iter_formatted_chunks, iter_raw_chunks, write_parquet
+
+CHUNKSIZE = 1000
+
+
+@pytest.fixture(scope='module')
+def whole():
+    return format_df(pd.concat(iter_raw_chunks(ZIP_PATH, chunksize=CHUNKSIZE), ignore_index=True))
+
+def test_chunks_match_format_df_of_the_whole_export(whole):
+    chunks = list(iter_formatted_chunks(ZIP_PATH, chunksize=CHUNKSIZE))
+    assert len(chunks) > 1
+    assert_same_values(pd.concat(chunks, ignore_index=True), whole)
+
+def test_parquet_of_the_chunks_reads_back_the_same(whole, tmp_path):
+    pytest.importorskip('pyarrow')
+    target = str(tmp_path / 'stream.parquet')
+    rows = write_parquet(iter_formatted_chunks(ZIP_PATH, chunksize=CHUNKSIZE), target)
+    assert rows == len(whole)
+    assert_same_values(pd.read_parquet(target), whole)
+
+def test_chunk_aggregates_match_the_whole_export(whole):
+    out = aggregate_chunks(iter_formatted_chunks(ZIP_PATH, chunksize=CHUNKSIZE), ['country_name'], count_unique=True)
+    expected = whole.groupby('country_name', observed=True).agg(rows=('restaurant_id', 'size'),
+                                                                restaurants=('restaurant_id', 'nunique'),
+                                                                mean_rating=('aggregate_rating', 'mean'))
+    out = out.set_index('country_name')
+    assert out['rows'].to_dict() == expected['rows'].to_dict()
+    assert out['restaurants'].to_dict() == expected['restaurants'].to_dict()
+    means = out['mean_aggregate_rating'].rename(None)
+    assert means.to_dict() == pytest.approx(expected['mean_rating'].to_dict())
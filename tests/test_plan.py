@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.data import load_dataset
+from utils.filters import filter_view
+from utils.plan import Aggregation, execute, fold_top
+
+METRICS = {'restaurants': ('restaurant_id', 'nunique'), 'rows': ('restaurant_id', 'size'),
+           'mean_rating': ('aggregate_rating', 'mean'), 'votes': ('votes', 'sum'),
+           'mean_cost': ('average_cost_for_two', 'mean')}
+PLAN = [
+    Aggregation('total', [], METRICS),
+    Aggregation('country', ['country_name'], METRICS),
+    Aggregation('city', ['city'], METRICS),
+    Aggregation('price_types', ['cuisines', 'price_range_type'], {'restaurant_id': ('restaurant_id', 'nunique')}),
+    Aggregation('delivery', ['has_delivery'], {'rating': ('aggregate_rating', 'mean'), 'cost': ('average_cost_for_two', 'mean')}),
+]
+# answered by the scan only: the cube keeps no min / max / dolar_price
+SCAN_PLAN = PLAN + [Aggregation('prices', ['country_name'], {'low': ('dolar_price', 'min'), 'high': ('dolar_price', 'max')})]
+
+STATES = 40
+
+
+@pytest.fixture(scope='module')
+def df():
+    return load_dataset()
+
+def random_state(df, rng):
+    # A sidebar state: each filter left empty (everything) half the time
+    def pick(col, most):
+        values = df[col].unique().tolist()
+        if rng.random() < 0.5:
+            return values
+        return [values[i] for i in rng.choice(len(values), int(rng.integers(1, most + 1)), replace=False)]
+
+    selections = {'country_name': pick('country_name', 3), 'price_range_type': pick('price_range_type', 2),
+                  'has_delivery': pick('has_delivery', 1), 'has_booking': pick('has_booking', 1)}
+    if rng.random() < 0.3:
+        selections['city'] = pick('city', 10)
+    max_cost = None
+    if rng.random() < 0.5:
+        max_cost = float(rng.choice(df['average_cost_for_two'].unique()))
+    return selections, max_cost
+
+def expected(df, selections, max_cost, agg):
+    # The aggregation by a plain pandas groupby over a boolean mask
+    mask = np.ones(len(df), dtype=bool)
+    for col, values in selections.items():
+        mask &= df[col].isin(values).to_numpy()
+    if max_cost is not None:
+        mask &= (df['average_cost_for_two'] <= max_cost).to_numpy()
+    rows = df[mask]
+    if len(agg.keys) == 0:
+        return pd.DataFrame({name: [rows[col].agg(func)] for name, (col, func) in agg.metrics.items()})
+    return rows.groupby(agg.keys, observed=True).agg(**agg.metrics)
+
+def assert_matches(result, wanted):
+    if len(result.index.names) > 1 or result.index.name is not None:
+        result, wanted = result.sort_index(), wanted.sort_index()
+    else:
+        result, wanted = result.reset_index(drop=True), wanted.reset_index(drop=True)
+    pd.testing.assert_frame_equal(result, wanted[list(result.columns)], check_dtype=False,
+                                  check_index_type=False, check_categorical=False)
+
+@pytest.mark.parametrize('plan, path', [(PLAN, 'cube'), (SCAN_PLAN, 'scan')])
+def test_execute_matches_pandas_on_random_filters(df, plan, path):
+    rng = np.random.default_rng(0)
+    answered_by_cube = 0
+    for _ in range(STATES):
+        selections, max_cost = random_state(df, rng)
+        view, key = filter_view(df, selections, max_cost)
+        results, timings = execute(plan, view, key if path == 'cube' else None)
+        stages = [stage for stage, _ in timings]
+        answered_by_cube += stages == ['cube']
+        for agg in plan:
+            assert_matches(results[agg.name], expected(df, selections, max_cost, agg))
+    if path == 'cube':
+        # every threshold is a bucket edge of the shipped csv
+        assert answered_by_cube == STATES
+    else:
+        assert answered_by_cube == 0
+
+def test_fold_top_weights_the_other_mean():
+    frame = pd.DataFrame({'city': ['a', 'b', 'c', 'd', 'e'], 'restaurants': [50, 40, 30, 20, 10],
+                          'rows': [60, 40, 30, 25, 5], 'mean': [4.0, 3.0, 2.0, 1.0, 5.0]}).set_index('city')
+    out = fold_top(frame, 2, 'restaurants', weights={'mean': 'rows'})
+
+    assert list(out.index) == ['a', 'b', 'Other']
+    other = out.loc['Other']
+    assert other['restaurants'] == 60
+    assert other['rows'] == 60
+    assert other['mean'] == pytest.approx((30 * 2.0 + 25 * 1.0 + 5 * 5.0) / 60)
+    assert out.loc['a', 'mean'] == 4.0
+
+def test_fold_top_folds_per_remaining_key():
+    frame = pd.DataFrame({'cuisines': ['x', 'x', 'y', 'z', 'z'], 'price': ['cheap', 'normal', 'cheap', 'cheap', 'normal'],
+                          'restaurant_id': [5, 4, 3, 2, 1]}).set_index(['cuisines', 'price'])
+    out = fold_top(frame, 1, 'restaurant_id')
+
+    assert list(out.index) == [('x', 'cheap'), ('x', 'normal'), ('Other', 'cheap'), ('Other', 'normal')]
+    assert out['restaurant_id'].tolist() == [5, 4, 5, 1]
+
+def test_fold_top_keeps_everything_under_n():
+    frame = pd.DataFrame({'city': ['a', 'b'], 'restaurants': [1, 2]}).set_index('city')
+    out = fold_top(frame, 5, 'restaurants')
+    assert list(out.index) == ['b', 'a']
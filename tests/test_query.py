@@ -0,0 +1,60 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+from utils.data import load_dataset
+from utils.query import query, read_batch, write
+
+
+@pytest.fixture(scope='module')
+def df():
+    return load_dataset()
+
+def test_grouped_query_matches_pandas(df):
+    out = query(df, by=['city'], countries=['India', 'Brazil'], delivery='yes', services='restaurants', max_price=500)
+
+    rows = df[df['country_name'].isin(['India', 'Brazil']) & df['has_delivery'] & (df['average_cost_for_two'] <= 500)]
+    expected = rows.groupby('city', observed=True).agg(restaurants=('restaurant_id', 'nunique'),
+                                                       mean_rating=('aggregate_rating', 'mean'))
+    assert out['restaurants'].is_monotonic_decreasing
+    assert out.set_index('city')['restaurants'].to_dict() == expected['restaurants'].to_dict()
+    pd.testing.assert_series_equal(out.set_index('city')['mean_rating'].sort_index(),
+                                   expected['mean_rating'].sort_index(), check_categorical=False, check_index_type=False)
+
+def test_totals_and_top(df):
+    total = query(df)
+    assert len(total) == 1
+    assert total.loc[0, 'restaurants'] == df['restaurant_id'].nunique()
+
+    top = query(df, by=['country_name'], top=3)
+    assert list(top['country_name'])[-1] == 'Other'
+    assert len(top) == 4
+    assert top['rows'].sum() == len(df)
+
+def test_bad_parameters(df):
+    with pytest.raises(ValueError):
+        query(df, by=['restaurant_name'])
+    with pytest.raises(ValueError):
+        query(df, delivery='maybe')
+
+def test_batch_output(df, tmp_path):
+    batch = tmp_path / 'queries.jsonl'
+    batch.write_text('{"name": "india", "by": ["city"], "countries": ["India"], "top": 2}\n\n'
+                     '{"by": ["price_range_type"], "booking": true}\n')
+    queries = read_batch(str(batch))
+    assert [name for name, _ in queries] == ['india', '3']
+    results = [(name, query(df, **params)) for name, params in queries]
+
+    csv = io.StringIO()
+    write(results, 'csv', csv)
+    table = pd.read_csv(io.StringIO(csv.getvalue()))
+    assert list(table.columns[:2]) == ['query', 'city']
+    assert table['query'].value_counts().to_dict() == {'india': 3, '3': len(results[1][1])}
+
+    lines = io.StringIO()
+    write(results, 'json', lines)
+    parsed = [json.loads(line) for line in lines.getvalue().splitlines()]
+    assert [item['query'] for item in parsed] == ['india', '3']
+    assert parsed[0]['rows'][-1]['city'] == 'Other'
@@ -0,0 +1,41 @@
+import json
+import os
+
+import pytest
+
+from utils import reports
+from utils.data import load_dataset
+
+SPECS = [('country', 'Qatar', {'country_name': ['Qatar']}),
+         ('city', 'Brasília', {'city': ['Brasília']})]
+# no rows: the report cannot pick a best restaurant and fails
+BROKEN = ('city', 'Atlantis', {'city': ['Atlantis']})
+
+
+@pytest.fixture(scope='module')
+def df():
+    return load_dataset()
+
+def built(df, out, specs, **kwargs):
+    return sorted(reports.run(df, specs, str(out), ['json'], workers=1, **kwargs))
+
+def test_unchanged_reports_are_skipped(df, tmp_path):
+    assert built(df, tmp_path, SPECS) == [('city', 'Brasília'), ('country', 'Qatar')]
+    with open(tmp_path / 'country' / 'Qatar.json') as f:
+        report = json.load(f)
+    assert report['metrics']['countries'] == 1
+
+    assert built(df, tmp_path, SPECS) == []
+    # a missing output or --force builds again
+    os.remove(tmp_path / 'city' / 'Brasília.json')
+    assert built(df, tmp_path, SPECS) == [('city', 'Brasília')]
+    assert built(df, tmp_path, SPECS, force=True) == [('city', 'Brasília'), ('country', 'Qatar')]
+
+def test_a_failed_report_keeps_the_finished_ones(df, tmp_path):
+    with pytest.raises(IndexError):
+        built(df, tmp_path, SPECS + [BROKEN])
+
+    with open(tmp_path / 'manifest.json') as f:
+        manifest = json.load(f)
+    assert sorted(manifest) == ['city/Brasília', 'country/Qatar']
+    assert built(df, tmp_path, SPECS) == []
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.topk import top_k
+
+
+def reference(df, k, by, ascending):
+    return df.sort_values(by, ascending=ascending, kind='stable').head(k)
+
+@pytest.fixture(scope='module')
+def df():
+    # few distinct values, so most keys tie; NaN in both number columns
+    rng = np.random.default_rng(0)
+    n = 500
+    rating = rng.integers(0, 6, n) / 2
+    rating[rng.choice(n, 20, replace=False)] = np.nan
+    votes = rng.integers(0, 4, n).astype(float)
+    votes[rng.choice(n, 20, replace=False)] = np.nan
+    return pd.DataFrame({'rating': rating, 'votes': votes, 'name': rng.choice(list('abcde'), n),
+                         'open': rng.random(n) < 0.5})
+
+@pytest.mark.parametrize('by, ascending', [
+    (['rating', 'votes'], [False, False]),
+    (['rating', 'votes'], [True, False]),
+    (['name', 'rating'], [True, False]),
+    (['open', 'votes', 'name'], [False, True, False]),
+    ('rating', True),
+])
+@pytest.mark.parametrize('k', [0, 1, 7, 100, 499, 500, 1000])
+def test_top_k_matches_sort_values_head(df, k, by, ascending):
+    pd.testing.assert_frame_equal(top_k(df, k, by, ascending), reference(df, k, by, ascending))
+
+def test_all_ties_keep_row_order():
+    df = pd.DataFrame({'rating': [4.0] * 6, 'votes': [1] * 6}, index=list('uvwxyz'))
+    assert list(top_k(df, 3, ['rating', 'votes'], [False, False]).index) == ['u', 'v', 'w']
+
+def test_empty_frame():
+    df = pd.DataFrame({'rating': pd.Series([], dtype=float)})
+    assert len(top_k(df, 3, 'rating')) == 0
@@ -0,0 +1,95 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Memory budget of the shared result cache, in MB
+RESULT_CACHE_MB = float(os.environ.get('ZOMATO_RESULT_CACHE_MB', 64))
+
+
+def sizeof(value):
+    # Approximate resident size of a cached value
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(usage, pd.Series) else int(usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    # Bounded in-memory cache shared by every session of the process.
+    # Entries are evicted least recently used first once the summed size
+    # goes over max_bytes; a single value larger than the budget is not
+    # stored at all.
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key][0]
+            self.misses += 1
+            return default
+
+    def put(self, key, value, size=None):
+        if size is None:
+            size = sizeof(value)
+        if size > self.max_bytes:
+            return value
+        with self.lock:
+            if key in self.entries:
+                self.bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, old_size) = self.entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        # compute runs outside the lock; two sessions missing the same key at
+        # once both compute it and the second put wins
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': self.hits / total if total else 0.0,
+                    'entries': len(self.entries),
+                    'bytes': self.bytes,
+                    'max_bytes': self.max_bytes}
+
+
+# Filtered row indices and chart aggregates, keyed by
+# FilterIndex.filter_key(...) + (name,)
+result_cache = LRUCache(int(RESULT_CACHE_MB * 2**20))
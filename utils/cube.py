@@ -0,0 +1,137 @@
+import threading
+
+import numpy as np
+
+from utils.filters import COST_COLUMN, decode_key, index_for_key
+
+# Dimensions of the cube: everything the sidebars filter on plus the chart
+# group keys. has_table_booking duplicates has_booking and is kept so the
+# Company page filters can be answered too; correlated dimensions do not add
+# cells.
+DIMENSIONS = ['country_name', 'city', 'cuisines', 'price_range_type', 'has_delivery',
+              'has_booking', 'is_delivering_now', 'has_table_booking']
+MEASURES = ['rows', 'restaurants', 'rating_sum', 'votes_sum', 'cost_sum']
+MAX_COST_BUCKETS = 256
+
+# (column, aggregation) pairs a rollup can answer, and the rollup column
+# holding each
+ROLLUP_METRICS = {
+    ('restaurant_id', 'nunique'): 'restaurants',
+    ('restaurant_id', 'size'): 'rows',
+    ('aggregate_rating', 'sum'): 'rating_sum',
+    ('votes', 'sum'): 'votes_sum',
+    (COST_COLUMN, 'sum'): 'cost_sum',
+    ('aggregate_rating', 'mean'): 'mean_rating',
+    ('votes', 'mean'): 'mean_votes',
+    (COST_COLUMN, 'mean'): 'mean_cost',
+}
+
+
+class Cube:
+    # Materialized aggregate over DIMENSIONS plus a bucketed cost dimension.
+    # Each cell holds the row count, the distinct restaurants and the sums of
+    # rating, votes and cost, so any chart grouped by a subset of the
+    # dimensions under any sidebar selection is a sum over cells.
+    #
+    # The price slider maps to whole cost buckets. With up to
+    # MAX_COST_BUCKETS distinct costs every cost gets its own bucket and all
+    # thresholds are exact; otherwise buckets are quantiles and a threshold
+    # that falls inside a bucket cannot be answered (rollup returns None and
+    # the caller goes back to the raw rows).
+    #
+    # Summing per-cell distinct restaurants is exact only when a restaurant
+    # never spans two cells (true for the zomato export, where repeated ids
+    # are identical rows); restaurants_additive records the check.
+
+    def __init__(self, df, dimensions=DIMENSIONS, cost_column=COST_COLUMN,
+                 max_cost_buckets=MAX_COST_BUCKETS):
+        self.dimensions = [dim for dim in dimensions if dim in df.columns]
+
+        cost = df[cost_column].to_numpy()
+        edges = np.unique(cost)
+        if len(edges) > max_cost_buckets:
+            edges = np.unique(np.quantile(cost, np.linspace(0, 1, max_cost_buckets + 1)[1:],
+                                          method='higher'))
+        # bucket i holds (edges[i-1], edges[i]]
+        bucket = np.searchsorted(edges, cost, side='left')
+        self.edges = edges
+        self.bucket_min = np.full(len(edges), np.inf)
+        np.minimum.at(self.bucket_min, bucket, cost)
+
+        keys = self.dimensions + ['cost_bucket']
+        cells = df.assign(cost_bucket=bucket).groupby(keys, observed=True)
+        self.cells = cells.agg(rows=('restaurant_id', 'size'),
+                               restaurants=('restaurant_id', 'nunique'),
+                               rating_sum=('aggregate_rating', 'sum'),
+                               votes_sum=('votes', 'sum'),
+                               cost_sum=(cost_column, 'sum')).reset_index()
+
+        spans = df.assign(cost_bucket=bucket).groupby('restaurant_id')[keys].nunique()
+        self.restaurants_additive = bool((spans <= 1).all().all())
+
+    def cost_buckets(self, max_cost):
+        # Number of leading buckets admitted by max_cost, None if max_cost
+        # splits a bucket
+        j = np.searchsorted(self.edges, max_cost, side='right')
+        if j < len(self.edges) and self.bucket_min[j] <= max_cost:
+            return None
+        return j
+
+    def rollup(self, by, selections, max_cost=None):
+        # Sum of the cells under selections ({dimension: values or None}),
+        # grouped by `by`, with means derived from the sums. Indexed by `by`
+        # like a groupby. None when the cube cannot answer exactly.
+        if any(col not in self.dimensions for col in list(by) + list(selections)):
+            return None
+
+        cells = self.cells
+        mask = np.ones(len(cells), dtype=bool)
+        for col, values in selections.items():
+            if values is not None:
+                mask &= cells[col].isin(values).to_numpy()
+        if max_cost is not None:
+            n_buckets = self.cost_buckets(max_cost)
+            if n_buckets is None:
+                return None
+            mask &= cells['cost_bucket'].to_numpy() < n_buckets
+
+        if len(by) == 0:
+            # grand total
+            out = cells.loc[mask, MEASURES].sum().to_frame().T
+        else:
+            out = cells.loc[mask].groupby(list(by), observed=True)[MEASURES].sum()
+        out['mean_rating'] = out['rating_sum'] / out['rows']
+        out['mean_votes'] = out['votes_sum'] / out['rows']
+        out['mean_cost'] = out['cost_sum'] / out['rows']
+        return out
+
+
+# One cube per filter index (i.e. per shared frame), built on first rollup
+_lock = threading.Lock()
+
+def get_cube(index):
+    with _lock:
+        cube = getattr(index, 'cube', None)
+        if cube is None:
+            cube = Cube(index.frame())
+            index.cube = cube
+        return cube
+
+def rollup(key, by, distinct=False):
+    # Answer a chart aggregate for the filter state behind `key` from the
+    # cube. distinct=True asks for exact distinct restaurants. Returns None
+    # when the raw rows have to be used instead.
+    index = index_for_key(key)
+    cube = get_cube(index)
+    if distinct and not cube.restaurants_additive:
+        return None
+
+    selections, n_cost_rows = decode_key(key)
+    if n_cost_rows == 0:
+        max_cost = -np.inf
+    elif n_cost_rows >= index.n_rows:
+        max_cost = None
+    else:
+        # highest cost the slider lets through
+        max_cost = index.sorted_cost[n_cost_rows - 1]
+    return cube.rollup(by, selections, max_cost)
@@ -0,0 +1,354 @@
+import contextlib
+import hashlib
+import os
+import threading
+import time
+
+import pandas as pd
+import inflection
+
+# Source csv of the app; ZOMATO_DATASET points it at another export
+# (a scaled-up or synthetic one for load tests)
+DATASET_PATH = os.environ.get('ZOMATO_DATASET', 'datasets/zomato.csv')
+
+
+# Preenchimento do nome dos países
+COUNTRIES = {
+1: "India",
+14: "Australia",
+30: "Brazil",
+37: "Canada",
+94: "Indonesia",
+148: "New Zeland",
+162: "Philippines",
+166: "Qatar",
+184: "Singapure",
+189: "South Africa",
+191: "Sri Lanka",
+208: "Turkey",
+214: "United Arab Emirates",
+215: "England",
+216: "United States of America",
+}
+
+# Conversão dólar
+CURRENCY = {
+ "India": 83,
+ "Australia": 1.47,
+ "Brazil": 5.20,
+ "Canada": 1.36,
+ "Indonesia": 15.97,
+ "New Zeland": 1.61,
+ "Philippines": 55.11,
+ "Qatar": 3.64,
+ "Singapure": 1.34,
+ "South Africa": 18.23,
+ "Sri Lanka": 365,
+ "Turkey": 19,
+ "United Arab Emirates": 3.7,
+ "England": 0.83,
+ "United States of America": 1,
+}
+
+# Criação do Tipo de Categoria de Comida (anything else is "gourmet")
+PRICE_TYPES = {
+1: "cheap",
+2: "normal",
+3: "expensive",
+}
+
+# Criação do nome das Cores
+COLORS = {
+"3F7E00": "darkgreen",
+"5BA829": "green",
+"9ACD32": "lightgreen",
+"CDD614": "orange",
+"FFBA00": "red",
+"CBCBC8": "darkred",
+"FF7800": "darkred",
+}
+
+def country_name(country_id):
+    return COUNTRIES[country_id]
+
+def to_dolar(country_name):
+    return CURRENCY[country_name]
+
+def create_price_type(price_range):
+    return PRICE_TYPES.get(price_range, "gourmet")
+
+def color_name(color_code):
+    return COLORS[color_code]
+
+def map_or_raise(series, mapping):
+    # Vectorized dict lookup that fails on unknown keys like the scalar helpers
+    mapped = series.map(mapping)
+    missing = mapped.isna()
+    if missing.any():
+        raise KeyError(series[missing].iloc[0])
+    return mapped
+
+def map_uniques(series, func):
+    # Apply func once per distinct value and broadcast back with the codes
+    codes, uniques = pd.factorize(series)
+    values = pd.Index(uniques).map(func).to_numpy()
+    return pd.Series(values.take(codes), index=series.index, name=series.name)
+
+def rename_columns(dataframe):
+    # Renomear as colunas do DataFrame
+    df = dataframe.copy()
+    title = lambda x: inflection.titleize(x)
+    snakecase = lambda x: inflection.underscore(x)
+    spaces = lambda x: x.replace(" ", "")
+    cols_old = list(df.columns)
+    cols_old = list(map(title, cols_old))
+    cols_old = list(map(spaces, cols_old))
+    cols_new = list(map(snakecase, cols_old))
+    df.columns = cols_new
+    return df
+
+def format_df(dataframe):
+    # Formatting df
+    # Every derived column is built column-wise: dict lookups, string work
+    # done once per distinct value, column division. No per-row Python calls.
+    df = rename_columns(dataframe)
+    # Removing NaN
+    df = df.loc[~df['cuisines'].isna(),:]
+    # Removing columns
+    df = df.drop(columns=['switch_to_order_menu'])
+    # Column price_range_type
+    df['price_range_type'] = df['price_range'].map(PRICE_TYPES).fillna("gourmet")
+    # Column country_name
+    df['country_name'] = map_or_raise(df['country_code'], COUNTRIES)
+    # Columns color_name
+    df['color_name'] = map_or_raise(df['rating_color'], COLORS)
+    # Cuisines
+    df['cuisines'] = map_uniques(df['cuisines'], lambda x: x.split(",")[0])
+    # Changing types. restaurant_id stays the csv's integer (the original
+    # cast it to str too): it is only ever counted distinct, which gives the
+    # same numbers on integers, at 8 bytes a row instead of a Python string
+    df['country_code'] = map_uniques(df['country_code'], str)
+    # Dolar conversion
+    df['dolar_price'] = (df['average_cost_for_two'] / df['country_name'].map(CURRENCY)).round(2)
+    df = df.loc[ df['dolar_price'] < 17006814.29 ]
+    # Convert boolean colums
+    df['has_delivery'] = df['has_online_delivery'] == 1
+    df['has_booking'] = df['has_table_booking'] == 1
+    # Compact dtypes
+    df = compact_dtypes(df)
+    # Reset index
+    df = df.reset_index(drop=True)
+
+    return df
+
+# Compact schema of the formatted frame: dictionary-encoded low-cardinality
+# text, small ints for flags and codes, float32 coordinates. Ratings and
+# prices stay float64: the charts round their means to 2 decimals and
+# float32 would leak values like 4.0599999 into the labels.
+# A text column is listed only if category_savings shows it shrinking the
+# frame: on the shipped csv most drop to 2-6% of their object size;
+# locality / locality_verbose (~3 rows per value) to about 45%.
+CATEGORY_COLUMNS = ['country_code', 'country_name', 'city', 'locality', 'locality_verbose', 'cuisines',
+                    'currency', 'price_range_type', 'rating_color', 'color_name', 'rating_text']
+DTYPES = {
+    'has_table_booking': 'int8',
+    'has_online_delivery': 'int8',
+    'is_delivering_now': 'int8',
+    'price_range': 'int8',
+    'votes': 'int32',
+    'average_cost_for_two': 'int32',
+    'latitude': 'float32',
+    'longitude': 'float32',
+    'has_delivery': 'bool',
+    'has_booking': 'bool',
+}
+
+def compact_dtypes(df):
+    df = df.copy()
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    for col, dtype in DTYPES.items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def memory_report(df):
+    # Bytes per column (deep, i.e. counting the Python strings)
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({'dtype': df.dtypes.astype(str), 'bytes': usage})
+    report['share'] = (report['bytes'] / report['bytes'].sum()).round(3)
+    return report.sort_values('bytes', ascending=False)
+
+def category_savings(df):
+    # memory_report bytes of every CATEGORY_COLUMNS column of a formatted
+    # frame as plain values and as a category
+    columns = [col for col in CATEGORY_COLUMNS if col in df.columns]
+    plain = memory_report(df.astype({col: object for col in columns}))
+    report = pd.DataFrame({'object': plain.loc[columns, 'bytes'],
+                           'category': memory_report(df).loc[columns, 'bytes']})
+    report['ratio'] = (report['category'] / report['object']).round(3)
+    return report
+
+
+#########################
+### Shared dataset   ###
+#########################
+
+# One formatted frame per server process, shared by every page and every
+# session. Streamlit re-executes the page scripts on each rerun but keeps
+# imported modules alive, so the state below survives across reruns.
+# The frame is shared without copying: callers must treat it as read-only
+# (filter_df and the charts only ever build new frames from it).
+
+_lock = threading.Lock()
+_datasets = {}
+CACHE_STATS = {'hits': 0, 'misses': 0, 'load_seconds': 0.0, 'hash': None, 'source': None}
+
+def file_hash(path, chunk_size=1 << 20):
+    # sha256 of the file content
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+#########################
+### Columnar snapshot ###
+#########################
+
+# format_df output written once to a compressed parquet file whose name
+# carries the source content hash, so a changed csv never matches an old
+# snapshot. Bump SNAPSHOT_VERSION whenever format_df output changes
+# (2: compact schema, integer restaurant_id).
+# Build ahead of a deploy with:  python -m utils.data
+
+SNAPSHOT_DIR = 'datasets/snapshots'
+SNAPSHOT_VERSION = 2
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+def snapshot_prefix(path):
+    # stem and a hash of the absolute source path, so two sources with the
+    # same file name never share (or clean up) each other's snapshots
+    stem = os.path.splitext(os.path.basename(path))[0]
+    source = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:8]
+    return '{}-{}-'.format(stem, source)
+
+def snapshot_path(path, digest):
+    name = '{}v{}-{}.parquet'.format(snapshot_prefix(path), SNAPSHOT_VERSION, digest[:16])
+    return os.path.join(SNAPSHOT_DIR, name)
+
+def stage(trace, name):
+    # trace.stage(name) when a utils.trace.Trace is given, nothing otherwise
+    return trace.stage(name) if trace is not None else contextlib.nullcontext()
+
+def build_snapshot(path=DATASET_PATH, digest=None, trace=None):
+    if digest is None:
+        digest = file_hash(path)
+    target = snapshot_path(path, digest)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    with stage(trace, 'read_csv'):
+        raw = pd.read_csv(path)
+    with stage(trace, 'format_df'):
+        df = format_df(raw)
+    # write aside and rename, so concurrent readers never see a partial file
+    with stage(trace, 'write_snapshot'):
+        tmp = '{}.{}.tmp'.format(target, os.getpid())
+        df.to_parquet(tmp, compression='zstd', index=False)
+        os.replace(tmp, target)
+
+    # drop snapshots of older versions of the same source
+    prefix = snapshot_prefix(path)
+    for name in os.listdir(SNAPSHOT_DIR):
+        old = os.path.join(SNAPSHOT_DIR, name)
+        if name.startswith(prefix) and name.endswith('.parquet') and old != target:
+            os.remove(old)
+    return target
+
+def read_snapshot(path=DATASET_PATH, columns=None, digest=None, trace=None):
+    # Formatted frame straight from the snapshot, (re)built if missing
+    if digest is None:
+        digest = file_hash(path)
+    target = snapshot_path(path, digest)
+    if not os.path.exists(target):
+        with stage(trace, 'build_snapshot'):
+            build_snapshot(path, digest, trace)
+    with stage(trace, 'read_snapshot'):
+        return pd.read_parquet(target, columns=columns)
+
+def load_dataset(path=None, columns=None, trace=None):
+    # path defaults to DATASET_PATH as set when called.
+    # The content hash is only recomputed when (mtime, size) changes, so a
+    # hit costs a single os.stat call.
+    # columns restricts the load to a subset (read straight from the
+    # snapshot); each distinct subset is cached on its own.
+    # With a trace, each step is a stage of its own: a hit shows as 'cached'
+    # alone, a cold load as hash / read_csv / format_df / write_snapshot...
+    if path is None:
+        path = DATASET_PATH
+    stat = os.stat(path)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    key = (path, tuple(columns) if columns is not None else None)
+
+    with _lock:
+        entry = _datasets.get(key)
+        if entry is not None and entry['stat'] == stat_key:
+            with stage(trace, 'cached'):
+                CACHE_STATS['hits'] += 1
+                return entry['df']
+
+        with stage(trace, 'hash'):
+            digest = file_hash(path)
+        if entry is not None and entry['hash'] == digest:
+            # touched but not changed
+            with stage(trace, 'cached'):
+                entry['stat'] = stat_key
+                CACHE_STATS['hits'] += 1
+                return entry['df']
+
+        start = time.perf_counter()
+        if HAS_PYARROW:
+            df = read_snapshot(path, columns=columns, digest=digest, trace=trace)
+            source = 'snapshot'
+        else:
+            with stage(trace, 'read_csv'):
+                raw = pd.read_csv(path)
+            with stage(trace, 'format_df'):
+                df = format_df(raw)
+            if columns is not None:
+                df = df.loc[:, list(columns)]
+            source = 'csv'
+        elapsed = time.perf_counter() - start
+
+        _datasets[key] = {'stat': stat_key, 'hash': digest, 'df': df}
+        CACHE_STATS['misses'] += 1
+        CACHE_STATS['load_seconds'] = elapsed
+        CACHE_STATS['hash'] = digest
+        CACHE_STATS['source'] = source
+        return df
+
+def cache_stats():
+    with _lock:
+        stats = dict(CACHE_STATS)
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / total if total else 0.0
+    return stats
+
+def clear_dataset_cache():
+    with _lock:
+        _datasets.clear()
+
+
+if __name__ == '__main__':
+    print(build_snapshot())
+    df = read_snapshot()
+    report = memory_report(df)
+    print(report.to_string())
+    print('total: {:.2f} MB'.format(report['bytes'].sum() / 2**20))
+    print(category_savings(df).to_string())
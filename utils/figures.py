@@ -0,0 +1,139 @@
+import base64
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from plotly.subplots import make_subplots
+
+from utils.cache import LRUCache
+
+# Memory budget of the figure cache, in MB (counted as serialized JSON)
+FIGURE_CACHE_MB = float(os.environ.get('ZOMATO_FIGURE_CACHE_MB', 32))
+
+# Typed-array output: numeric trace arrays of at least TYPED_ARRAY_MIN_LENGTH
+# values go to the browser as base64 {"dtype", "bdata"} objects (plotly.js
+# >= 2.28 decodes them). Only coordinates and marker sizes are cast to
+# float32; every other float (customdata, z, text...) can end up in a
+# tooltip and stays float64. ZOMATO_TYPED_ARRAYS=0 turns it off.
+TYPED_ARRAYS = os.environ.get('ZOMATO_TYPED_ARRAYS', '1') != '0'
+TYPED_ARRAY_MIN_LENGTH = 32
+SHORT_FLOAT_KEYS = {'lat', 'lon', 'size'}
+INT_TYPES = [('i1', np.int8), ('u1', np.uint8), ('i2', np.int16), ('u2', np.uint16),
+             ('i4', np.int32), ('u4', np.uint32)]
+
+
+def fingerprint(frame):
+    # Content hash of a frame: values, index, column names and dtypes
+    digest = hashlib.sha1()
+    digest.update(pd.util.hash_pandas_object(frame, index=True).to_numpy().tobytes())
+    digest.update(repr(list(frame.columns)).encode())
+    digest.update(repr([str(dtype) for dtype in frame.dtypes]).encode())
+    return digest.hexdigest()
+
+
+class FigureCache(LRUCache):
+    # LRUCache of built plotly figures keyed by (chart spec, fingerprint of
+    # the data). The Figure object itself is kept: st.plotly_chart serializes
+    # a Figure without validating it again, which a stored dict or JSON
+    # would not skip. Entries are sized by their serialized JSON.
+
+    def get_or_build(self, spec, frame, build):
+        return self.get_or_compute((spec, fingerprint(frame)), build)
+
+    def put(self, key, fig):
+        return super().put(key, fig, size=len(pio.to_json(fig, validate=False)))
+
+
+figure_cache = FigureCache(int(FIGURE_CACHE_MB * 2**20))
+
+
+def dual_axis_chart(df_aux, x, bar, line, bar_name, line_name="Mean Rating",
+                    bar_title=" Restaurants ", line_title=" Rating "):
+    # Bars on the primary y-axis and a line on the secondary one, built once
+    # per (spec, data) and shared by every rerun and session
+    spec = ('dual_axis', x, bar, line, bar_name, line_name, bar_title, line_title)
+
+    def build():
+        # use specs parameter in make_subplots function
+        # to create secondary y-axis
+        fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+        # plot a scatter chart by specifying the x and y values
+        # Use add_trace function to specify secondary_y axes.
+        fig.add_trace(
+            go.Bar(x=df_aux[x], y=df_aux[bar], name=bar_name),
+            secondary_y=False)
+
+        # Use add_trace function and specify secondary_y axes = True.
+        fig.add_trace(
+            go.Scatter(x=df_aux[x], y=df_aux[line], name=line_name),
+            secondary_y=True)
+
+        # Naming y-axes
+        fig.update_yaxes(title_text=bar_title, secondary_y=False)
+        fig.update_yaxes(title_text=line_title, secondary_y=True)
+        return fig
+
+    return figure_cache.get_or_build(spec, df_aux[[x, bar, line]], build)
+
+
+def typed_array(values, float_dtype='f4'):
+    # {"dtype", "bdata"[, "shape"]} for a numeric array, None otherwise.
+    # Floats are cast to float_dtype; integers to the smallest type that
+    # holds them (float64 when none does).
+    array = np.asarray(values)
+    if array.dtype.kind not in 'iuf' or array.size == 0:
+        return None
+    if array.dtype.kind == 'f':
+        dtype, cast = float_dtype, np.dtype(float_dtype)
+    else:
+        low, high = array.min(), array.max()
+        dtype, cast = 'f8', np.float64
+        for name, int_type in INT_TYPES:
+            if np.iinfo(int_type).min <= low and high <= np.iinfo(int_type).max:
+                dtype, cast = name, int_type
+                break
+
+    out = {'dtype': dtype,
+           'bdata': base64.b64encode(np.ascontiguousarray(array, dtype=cast).tobytes()).decode('ascii')}
+    if array.ndim > 1:
+        out['shape'] = ','.join(str(n) for n in array.shape)
+    return out
+
+def encode_arrays(node, float_dtype='f4', min_length=TYPED_ARRAY_MIN_LENGTH):
+    # Replace, in place, every long numeric array of a trace dict (nested
+    # ones such as marker.size included) with its typed array; floats as
+    # float_dtype under SHORT_FLOAT_KEYS only
+    for key, value in node.items():
+        if isinstance(value, dict):
+            encode_arrays(value, float_dtype, min_length)
+        elif isinstance(value, (list, tuple, np.ndarray)) and len(value) >= min_length:
+            encoded = typed_array(value, float_dtype if key in SHORT_FLOAT_KEYS else 'f8')
+            if encoded is not None:
+                node[key] = encoded
+    return node
+
+
+class TypedArrayFigure(go.Figure):
+    # Figure whose numeric trace arrays serialize as typed arrays. Only
+    # to_dict changes, which is what st.plotly_chart and plotly.io.to_json
+    # serialize from.
+    float_dtype = 'f4'
+
+    def to_dict(self):
+        fig = super().to_dict()
+        for trace in fig.get('data', []):
+            encode_arrays(trace, self.float_dtype)
+        return fig
+
+
+def typed_arrays(fig):
+    # Switch a built figure to the typed-array output. The class is swapped
+    # in place: wrapping it in a new Figure would validate every trace again.
+    if TYPED_ARRAYS:
+        fig.__class__ = TypedArrayFigure
+    return fig
@@ -0,0 +1,207 @@
+import itertools
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from utils.cache import result_cache
+
+# Columns the sidebar filters can restrict, across all pages
+INDEX_COLUMNS = ['price_range_type', 'country_name', 'city', 'is_delivering_now',
+                 'has_table_booking', 'has_delivery', 'has_booking']
+COST_COLUMN = 'average_cost_for_two'
+
+
+class FilterIndex:
+    # Precomputed filter index over the shared frame: one packed bitmap
+    # (np.packbits, 1 bit per row) per distinct value of each filter column
+    # and the cost column pre-sorted for the price threshold. A selection ORs
+    # the bitmaps of the chosen values and ANDs the columns together; a
+    # column whose selection covers every value is skipped entirely, which
+    # is the common "empty = all" case of the sidebar.
+
+    tokens = itertools.count()
+
+    def __init__(self, df, columns=INDEX_COLUMNS, cost_column=COST_COLUMN):
+        # token tells cached results of different frames apart
+        self.token = next(self.tokens)
+        self.frame = weakref.ref(df)
+        self.n_rows = len(df)
+        self.bitmaps = {}
+        self.values = {}
+        for col in columns:
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col])
+            self.bitmaps[col] = {value: np.packbits(codes == code)
+                                 for code, value in enumerate(list(uniques))}
+            self.values[col] = {value: value for value in list(uniques)}
+
+        cost = df[cost_column].to_numpy()
+        self.cost_order = np.argsort(cost, kind='stable')
+        self.sorted_cost = cost[self.cost_order]
+
+    def column_bitmap(self, col, values):
+        # OR of the bitmaps of the selected values, None when nothing is
+        # filtered out
+        bitmaps = self.bitmaps[col]
+        selected = [bitmaps[value] for value in set(values) if value in bitmaps]
+        if len(selected) == len(bitmaps):
+            return None
+        if len(selected) == 0:
+            return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        return np.bitwise_or.reduce(selected)
+
+    def cost_bitmap(self, max_cost):
+        # rows with cost <= max_cost are a prefix of cost_order
+        k = np.searchsorted(self.sorted_cost, max_cost, side='right')
+        if k == self.n_rows:
+            return None
+        if k <= self.n_rows // 2:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[self.cost_order[:k]] = True
+        else:
+            mask = np.ones(self.n_rows, dtype=bool)
+            mask[self.cost_order[k:]] = False
+        return np.packbits(mask)
+
+    def filter_key(self, selections, max_cost=None):
+        # Canonical, hashable form of a filter state: selections sorted and
+        # mapped onto the stored values (so 1 and True agree on a bool
+        # column), "ALL" when every value is selected, and the price
+        # threshold replaced by the number of rows it lets through.
+        parts = []
+        for col in sorted(selections):
+            bitmaps = self.bitmaps[col]
+            known = {value for value in selections[col] if value in bitmaps}
+            if len(known) == len(bitmaps):
+                parts.append((col, 'ALL'))
+            else:
+                canonical = [self.values[col][value] for value in known]
+                parts.append((col, tuple(sorted(canonical, key=str))))
+        if max_cost is None:
+            parts.append(('cost', self.n_rows))
+        else:
+            parts.append(('cost', int(np.searchsorted(self.sorted_cost, max_cost, side='right'))))
+        return (self.token,) + tuple(parts)
+
+    def select(self, selections, max_cost=None):
+        # selections: {column: values}. Returns a boolean row mask.
+        bitmaps = [self.column_bitmap(col, values) for col, values in selections.items()]
+        if max_cost is not None:
+            bitmaps.append(self.cost_bitmap(max_cost))
+        bitmaps = [bitmap for bitmap in bitmaps if bitmap is not None]
+
+        if len(bitmaps) == 0:
+            return np.ones(self.n_rows, dtype=bool)
+        packed = np.bitwise_and.reduce(bitmaps)
+        return np.unpackbits(packed, count=self.n_rows).astype(bool)
+
+
+# One index per shared frame, built on first use. Keyed by id() with a
+# weak reference, so a reloaded frame gets a new index and the old one is
+# dropped with it. The lock is re-entrant because the weak reference
+# callback can run on a thread already holding it (a collection triggered
+# while building an index).
+_lock = threading.RLock()
+_indexes = {}
+
+def forget_index(key, ref):
+    # Weak reference callback: drop the entry of a collected frame, unless
+    # its id already belongs to a newer frame
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0] is ref:
+            del _indexes[key]
+
+def get_filter_index(df):
+    key = id(df)
+    with _lock:
+        entry = _indexes.get(key)
+        if entry is not None and entry[0]() is df:
+            return entry[1]
+
+        index = FilterIndex(df)
+        _indexes[key] = (weakref.ref(df, lambda ref: forget_index(key, ref)), index)
+        return index
+
+def index_for_key(key):
+    # The FilterIndex a filter_key was produced by
+    with _lock:
+        # a copy, as a callback run on this thread would change the dict
+        for _, index in list(_indexes.values()):
+            if index.token == key[0]:
+                return index
+    raise KeyError('no filter index for key {}'.format(key[0]))
+
+def decode_key(key):
+    # filter_key back to ({column: values or None for all}, rows admitted by
+    # the price threshold)
+    selections = {}
+    n_cost_rows = None
+    for col, values in key[1:]:
+        if col == 'cost':
+            n_cost_rows = values
+        else:
+            selections[col] = None if values == 'ALL' else list(values)
+    return selections, n_cost_rows
+
+def filter_rows(df, selections, max_cost=None):
+    # Positions of the selected rows and the canonical key of the filter
+    # state; the positions are served from the shared result cache.
+    index = get_filter_index(df)
+    key = index.filter_key(selections, max_cost)
+    rows = result_cache.get_or_compute(key + ('rows',),
+                                       lambda: np.flatnonzero(index.select(selections, max_cost)))
+    return rows, key
+
+
+class FilteredView:
+    # The rows of the shared frame kept by a filter state, held as their
+    # positions instead of a copy of every column. Consumers gather only the
+    # columns they read: view['col'] for one Series, view.select(columns) for
+    # a frame. Both come back indexed by the row positions in the shared
+    # frame (its index is a RangeIndex), like df.iloc[rows] would be.
+
+    def __init__(self, base, rows, key=None):
+        self.base = base
+        self.rows = rows
+        self.key = key
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, col):
+        if isinstance(col, list):
+            return self.select(col)
+        return self.base[col].iloc[self.rows]
+
+    @property
+    def index(self):
+        return self.base.index[self.rows]
+
+    @property
+    def columns(self):
+        return self.base.columns
+
+    def select(self, columns):
+        # column by column: base.iloc[rows, columns] gathers the columns
+        # first over every row
+        return pd.DataFrame({col: self.base[col].array.take(self.rows) for col in columns},
+                            index=self.index)
+
+    def nbytes(self):
+        # what the view itself holds
+        return self.rows.nbytes
+
+def materialize(df, columns):
+    # Frame of the given columns from a frame or a FilteredView
+    if isinstance(df, FilteredView):
+        return df.select(list(dict.fromkeys(columns)))
+    return df
+
+def filter_view(df, selections, max_cost=None):
+    # filter_rows as a FilteredView over df
+    rows, key = filter_rows(df, selections, max_cost)
+    return FilteredView(df, rows, key), key
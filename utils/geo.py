@@ -0,0 +1,330 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.filters import get_filter_index
+
+# Server-side clustering for the map. Restaurants are binned on a lat/lon
+# grid whose cell size follows the zoom level (about CLUSTER_PIXELS screen
+# pixels per cell on 256 px web-mercator tiles), so the browser gets one
+# marker per occupied cell instead of one per row. From POINTS_ZOOM on the
+# rows are drawn as they are.
+CLUSTER_PIXELS = 60
+POINTS_ZOOM = 13
+TILE_PIXELS = 256
+
+# Spatial index: grid buckets of INDEX_CELL_DEG degrees, distances by haversine
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG = np.pi * EARTH_RADIUS_KM / 180
+INDEX_CELL_DEG = 0.1
+
+# Viewport of the map figure: mapbox draws 512 px tiles; the figure is about
+# MAP_WIDTH_PX x MAP_HEIGHT_PX in the wide layout. Rows within VIEWPORT_MARGIN
+# (fraction of the view) outside the edges are still sent.
+MAPBOX_TILE_PIXELS = 512
+MAP_WIDTH_PX = 1200
+MAP_HEIGHT_PX = 450
+VIEWPORT_MARGIN = 0.1
+MAX_MERCATOR_LAT = 85.0511
+# View of a map with no rows to centre on: the whole world
+WORLD_CENTER = {'lat': 0.0, 'lon': 0.0}
+WORLD_BOX = (-90.0, 90.0, -180.0, 180.0)
+
+# Density layer: cell sizes in degrees of the grid pyramid, coarse to fine;
+# each level divides the one above into 4 x 4 cells
+DENSITY_LEVELS = [4.0, 1.0, 0.25, 0.0625, 0.015625]
+
+
+def cell_size(zoom):
+    # Grid cell size in degrees at a zoom level
+    return 360 / (TILE_PIXELS * 2 ** zoom) * CLUSTER_PIXELS
+
+def grid_cells(df, zoom, lat='latitude', lon='longitude'):
+    # (column, row) of the grid cell of every row
+    size = cell_size(zoom)
+    cx = np.floor(df[lon].to_numpy(dtype=float) / size).astype(np.int64)
+    cy = np.floor(df[lat].to_numpy(dtype=float) / size).astype(np.int64)
+    return cx, cy
+
+def cluster_points(df, zoom, category, lat='latitude', lon='longitude', rating='aggregate_rating'):
+    # One row per occupied cell: centroid, count, mean rating, the most
+    # frequent value of `category` (ties go to the first in sort order) and
+    # its share of the cell
+    cx, cy = grid_cells(df, zoom, lat, lon)
+    cells = pd.DataFrame({'cx': cx, 'cy': cy,
+                          lat: df[lat].to_numpy(dtype=float),
+                          lon: df[lon].to_numpy(dtype=float),
+                          rating: df[rating].to_numpy(),
+                          category: df[category].to_numpy()})
+
+    clusters = cells.groupby(['cx', 'cy']).agg(**{lat: (lat, 'mean'),
+                                                  lon: (lon, 'mean'),
+                                                  'count': (rating, 'size'),
+                                                  'mean_rating': (rating, 'mean')})
+
+    dominant = cells.groupby(['cx', 'cy', category]).size().rename('dominant_count').reset_index()
+    dominant = dominant.sort_values('dominant_count', ascending=False, kind='stable')
+    dominant = dominant.drop_duplicates(['cx', 'cy']).set_index(['cx', 'cy'])
+
+    clusters = clusters.join(dominant)
+    clusters['share'] = clusters['dominant_count'] / clusters['count']
+    clusters['mean_rating'] = clusters['mean_rating'].round(2)
+    return clusters.drop(columns='dominant_count').reset_index(drop=True)
+
+
+def density_grid(df, levels=DENSITY_LEVELS, lat='latitude', lon='longitude', rating='aggregate_rating'):
+    # {cell size: occupied cells with centre latitude/longitude, count and
+    # mean rating}. One bincount over the rows at the finest level; every
+    # coarser level is summed from the cells of the finest, so its cost
+    # depends on the number of cells, not on the number of rows.
+    finest = levels[-1]
+    n_lon = int(round(360 / finest))
+    iy = np.clip(np.floor((df[lat].to_numpy(dtype=float) + 90) / finest), 0, 180 / finest - 1).astype(np.int64)
+    ix = np.floor((df[lon].to_numpy(dtype=float) + 180) / finest).astype(np.int64) % n_lon
+    cells, inverse = np.unique(iy * n_lon + ix, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(cells))
+    sums = np.bincount(inverse, weights=df[rating].to_numpy(dtype=float), minlength=len(cells))
+
+    grids = {}
+    for level in levels:
+        factor = int(round(level / finest))
+        cy = cells // n_lon // factor
+        cx = cells % n_lon // factor
+        coarse, inverse = np.unique(cy * (n_lon // factor) + cx, return_inverse=True)
+        level_counts = np.bincount(inverse, weights=counts, minlength=len(coarse))
+        level_sums = np.bincount(inverse, weights=sums, minlength=len(coarse))
+        grids[level] = pd.DataFrame({lat: (coarse // (n_lon // factor) + 0.5) * level - 90,
+                                     lon: (coarse % (n_lon // factor) + 0.5) * level - 180,
+                                     'count': level_counts.astype(np.int64),
+                                     'mean_rating': (level_sums / level_counts).round(2)})
+    return grids
+
+def grid_geojson(cells, size, lat='latitude', lon='longitude'):
+    # GeoJSON squares of side `size` degrees around the cell centres, the
+    # feature id being the row position in cells
+    features = []
+    for i, (y, x) in enumerate(zip(cells[lat].to_numpy(dtype=float), cells[lon].to_numpy(dtype=float))):
+        s, n = max(y - size / 2, -90.0), min(y + size / 2, 90.0)
+        w, e = x - size / 2, x + size / 2
+        features.append({'type': 'Feature', 'id': str(i), 'properties': {},
+                         'geometry': {'type': 'Polygon', 'coordinates': [[[w, s], [e, s], [e, n], [w, n], [w, s]]]}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+def density_level(zoom, levels=DENSITY_LEVELS):
+    # Pyramid level closest (in log scale) to half a cluster cell at zoom
+    target = cell_size(zoom) / 2
+    return min(levels, key=lambda level: abs(np.log(level / target)))
+
+def haversine(lat1, lon1, lat2, lon2):
+    # Great-circle distance in km, vectorized over numpy arrays
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def mercator_y(lat):
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+def mercator_lat(y):
+    return np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+
+def viewport(lat, lon, zoom, width=MAP_WIDTH_PX, height=MAP_HEIGHT_PX, margin=VIEWPORT_MARGIN):
+    # (south, north, west, east) seen by a map centred on (lat, lon) at
+    # zoom, widened by margin on every side. west/east stay unwrapped
+    # (may pass +-180); a view wider than the world spans -180..180.
+    world = MAPBOX_TILE_PIXELS * 2 ** zoom
+    half_width = width * (1 + 2 * margin) / 2
+    half_height = height * (1 + 2 * margin) / 2
+
+    dlon = half_width / world * 360
+    if dlon >= 180:
+        west, east = -180.0, 180.0
+    else:
+        west, east = lon - dlon, lon + dlon
+
+    lat = np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT)
+    dy = half_height / world * 2 * np.pi
+    y = mercator_y(lat)
+    south = max(float(mercator_lat(y - dy)), -90.0)
+    north = min(float(mercator_lat(y + dy)), 90.0)
+    if north >= MAX_MERCATOR_LAT:
+        north = 90.0
+    if south <= -MAX_MERCATOR_LAT:
+        south = -90.0
+    return south, north, west, east
+
+def in_lon_range(lon, west, east):
+    # west > east wraps over the antimeridian
+    if east - west >= 360:
+        return np.ones(len(lon), dtype=bool)
+    return (lon - west) % 360 <= (east - west) % 360
+
+def outside_counts(df, box, lat='latitude', lon='longitude'):
+    # Rows of df outside box counted by direction (N, NE, E, ...), one
+    # marker per direction placed just inside the box edge
+    south, north, west, east = box
+    lats = df[lat].to_numpy(dtype=float)
+    lons = df[lon].to_numpy(dtype=float)
+
+    dy = np.where(lats > north, 1, np.where(lats < south, -1, 0))
+    if east - west >= 360:
+        dx = np.zeros(len(lons), dtype=int)
+    else:
+        offset = (lons - west) % 360
+        width = east - west
+        # outside the range: nearer to the east edge or to the west edge
+        dx = np.where(offset <= width, 0, np.where(offset - width <= 360 - offset, 1, -1))
+
+    outside = (dx != 0) | (dy != 0)
+    counts = pd.DataFrame({'dy': dy[outside], 'dx': dx[outside]}).value_counts().rename('count').reset_index()
+
+    names = {(1, 0): 'N', (1, 1): 'NE', (0, 1): 'E', (-1, 1): 'SE',
+             (-1, 0): 'S', (-1, -1): 'SW', (0, -1): 'W', (1, -1): 'NW'}
+    inset_lat = (north - south) * 0.05
+    inset_lon = (east - west) * 0.05
+    middle_lat = (south + north) / 2
+    middle_lon = (west + east) / 2
+    counts[lat] = np.select([counts['dy'] == 1, counts['dy'] == -1],
+                            [north - inset_lat, south + inset_lat], middle_lat)
+    counts[lon] = np.select([counts['dx'] == 1, counts['dx'] == -1],
+                            [east - inset_lon, west + inset_lon], middle_lon)
+    counts[lon] = (counts[lon] + 180) % 360 - 180
+    counts['direction'] = [names[(y, x)] for y, x in zip(counts['dy'], counts['dx'])]
+    return counts.drop(columns=['dy', 'dx'])
+
+
+class SpatialIndex:
+    # Restaurants bucketed on a fixed lat/lon grid. Rows are sorted by cell
+    # id (row-major, longitude inside latitude), so the cells of one grid row
+    # crossed by a query box are one contiguous slice found by searchsorted.
+    # A radius query reads only the cells of its bounding box and checks
+    # those rows with haversine; k-nearest grows the radius until k rows
+    # fall inside it.
+    #
+    # Queries take the filter as `rows`, the sorted row positions selected
+    # by the sidebar (filter_rows), and return positions into the frame
+    # with distances in km, nearest first.
+
+    def __init__(self, df, lat='latitude', lon='longitude', cell_deg=INDEX_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.n_lon = int(np.ceil(360 / cell_deg))
+        self.n_lat = int(np.ceil(180 / cell_deg))
+        self.lat = df[lat].to_numpy(dtype=float)
+        self.lon = df[lon].to_numpy(dtype=float)
+
+        valid = np.flatnonzero(np.isfinite(self.lat) & np.isfinite(self.lon))
+        ids = self.cell_ids(self.lat[valid], self.lon[valid])
+        order = np.argsort(ids, kind='stable')
+        self.ids = ids[order]
+        self.order = valid[order]
+
+    def cell_ids(self, lat, lon):
+        iy = np.clip(np.floor((lat + 90) / self.cell_deg), 0, self.n_lat - 1).astype(np.int64)
+        ix = np.floor((lon + 180) / self.cell_deg).astype(np.int64) % self.n_lon
+        return iy * self.n_lon + ix
+
+    def cells_between(self, iy0, iy1, ix0, ix1):
+        # Rows in grid rows iy0..iy1 and grid columns ix0..ix1 (ix may run
+        # past either end of the grid and wraps around)
+        if ix1 - ix0 + 1 >= self.n_lon:
+            ix_ranges = [(0, self.n_lon - 1)]
+        elif ix0 < 0:
+            ix_ranges = [(0, ix1), (ix0 % self.n_lon, self.n_lon - 1)]
+        elif ix1 >= self.n_lon:
+            ix_ranges = [(ix0, self.n_lon - 1), (0, ix1 % self.n_lon)]
+        else:
+            ix_ranges = [(ix0, ix1)]
+
+        rows = np.arange(max(iy0, 0), min(iy1, self.n_lat - 1) + 1) * self.n_lon
+        low = np.concatenate([rows + ix0 for ix0, _ in ix_ranges])
+        high = np.concatenate([rows + ix1 for _, ix1 in ix_ranges])
+        starts = np.searchsorted(self.ids, low, side='left')
+        ends = np.searchsorted(self.ids, high, side='right')
+        slices = [self.order[start:end] for start, end in zip(starts, ends) if end > start]
+        if len(slices) == 0:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def candidates(self, lat, lon, radius_km):
+        # Rows in the grid cells covering the circle's bounding box
+        dlat = radius_km / KM_PER_DEG
+        iy0 = int(np.floor((lat - dlat + 90) / self.cell_deg))
+        iy1 = int(np.floor((lat + dlat + 90) / self.cell_deg))
+
+        # widest longitude span of the box, at its latitude closest to a pole
+        cos_lat = np.cos(np.radians(min(abs(lat) + dlat, 90)))
+        if cos_lat * 180 * KM_PER_DEG <= radius_km:
+            return self.cells_between(iy0, iy1, 0, self.n_lon - 1)
+        dlon = radius_km / (KM_PER_DEG * cos_lat)
+        ix0 = int(np.floor((lon - dlon + 180) / self.cell_deg))
+        ix1 = int(np.floor((lon + dlon + 180) / self.cell_deg))
+        return self.cells_between(iy0, iy1, ix0, ix1)
+
+    def keep_rows(self, positions, rows):
+        # the positions that are among the sorted filtered rows
+        if rows is None:
+            return positions
+        if len(rows) == 0:
+            return positions[:0]
+        found = np.minimum(np.searchsorted(rows, positions), len(rows) - 1)
+        return positions[rows[found] == positions]
+
+    def within(self, lat, lon, radius_km, rows=None):
+        # (positions, distances) of the rows within radius_km of (lat, lon)
+        positions = self.keep_rows(self.candidates(lat, lon, radius_km), rows)
+        distances = haversine(lat, lon, self.lat[positions], self.lon[positions])
+        inside = distances <= radius_km
+        positions, distances = positions[inside], distances[inside]
+        order = np.lexsort([positions, distances])
+        return positions[order], distances[order]
+
+    def in_box(self, box, rows=None):
+        # Sorted positions of the rows inside box = (south, north, west, east);
+        # west > east or east past 180 wraps over the antimeridian
+        south, north, west, east = box
+        iy0 = int(np.floor((south + 90) / self.cell_deg))
+        iy1 = int(np.floor((north + 90) / self.cell_deg))
+        ix0 = int(np.floor((west + 180) / self.cell_deg))
+        ix1 = int(np.floor((east + 180) / self.cell_deg))
+        if ix1 < ix0:
+            ix1 += self.n_lon
+        positions = self.keep_rows(self.cells_between(iy0, iy1, ix0, ix1), rows)
+
+        lat, lon = self.lat[positions], self.lon[positions]
+        inside = (lat >= south) & (lat <= north) & in_lon_range(lon, west, east)
+        return np.sort(positions[inside])
+
+    def nearest(self, lat, lon, k, rows=None, max_km=None):
+        # (positions, distances) of the k rows nearest to (lat, lon), within
+        # max_km when given
+        limit = np.pi * EARTH_RADIUS_KM if max_km is None else max_km
+        radius = min(self.cell_deg * KM_PER_DEG, limit)
+        while True:
+            positions, distances = self.within(lat, lon, radius, rows)
+            if len(positions) >= k or radius >= limit:
+                return positions[:k], distances[:k]
+            radius = min(radius * 4, limit)
+
+
+# One spatial index per shared frame, kept on its filter index like the cube
+_lock = threading.Lock()
+
+def get_spatial_index(df):
+    index = get_filter_index(df)
+    with _lock:
+        spatial = getattr(index, 'spatial', None)
+        if spatial is None:
+            spatial = SpatialIndex(df)
+            index.spatial = spatial
+        return spatial
+
+def restaurants_within(df, lat, lon, radius_km, rows=None):
+    # Rows of the shared frame df within radius_km, nearest first, with a
+    # distance_km column. rows: sorted positions selected by the filters.
+    positions, distances = get_spatial_index(df).within(lat, lon, radius_km, rows)
+    return df.iloc[positions].assign(distance_km=distances.round(2))
+
+def nearest_restaurants(df, lat, lon, k, rows=None, max_km=None):
+    positions, distances = get_spatial_index(df).nearest(lat, lon, k, rows, max_km)
+    return df.iloc[positions].assign(distance_km=distances.round(2))
@@ -0,0 +1,107 @@
+import argparse
+import os
+import zipfile
+
+import pandas as pd
+
+from utils.data import format_df
+
+ZIP_PATH = 'datasets/zomato.csv.zip'
+CHUNKSIZE = 100_000
+
+# Streaming ingestion for exports that do not fit in memory. The csv member
+# of the zip is decompressed as a stream and parsed CHUNKSIZE rows at a time;
+# every step of format_df is row-local, so each chunk is formatted on its
+# own. Peak memory is bounded by the chunk size, not by the input size.
+
+
+def iter_raw_chunks(path=ZIP_PATH, member=None, chunksize=CHUNKSIZE):
+    # Raw csv chunks from a .zip member (first .csv by default) or a plain csv
+    if not zipfile.is_zipfile(path):
+        yield from pd.read_csv(path, chunksize=chunksize)
+        return
+
+    with zipfile.ZipFile(path) as archive:
+        if member is None:
+            member = next(name for name in archive.namelist() if name.endswith('.csv'))
+        with archive.open(member) as stream:
+            yield from pd.read_csv(stream, chunksize=chunksize)
+
+def iter_formatted_chunks(path=ZIP_PATH, member=None, chunksize=CHUNKSIZE):
+    for chunk in iter_raw_chunks(path, member, chunksize):
+        df = format_df(chunk)
+        if len(df) > 0:
+            yield df
+
+def write_parquet(chunks, target):
+    # One row group per chunk. The schema is fixed by the first chunk so a
+    # later chunk with an all-NaN text column is cast instead of rejected.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    tmp = '{}.{}.tmp'.format(target, os.getpid())
+    writer = None
+    rows = 0
+    try:
+        for chunk in chunks:
+            if writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                writer = pq.ParquetWriter(tmp, table.schema, compression='zstd')
+            else:
+                table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+            writer.write_table(table)
+            rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        raise ValueError('no rows to write')
+    os.replace(tmp, target)
+    return rows
+
+def aggregate_chunks(chunks, keys, count_unique=False):
+    # Partial aggregates per group, merged chunk by chunk: row count and the
+    # sums of rating, votes and cost, so means can be derived at the end.
+    # count_unique also keeps the restaurant ids per group to return the
+    # exact nunique the dashboards show; memory then grows with distinct
+    # restaurants instead of staying constant.
+    keys = list(keys)
+    sums = ['aggregate_rating', 'votes', 'average_cost_for_two', 'dolar_price']
+    total = None
+    ids = {}
+
+    for chunk in chunks:
+        part = chunk.groupby(keys, observed=True).agg(rows=('restaurant_id', 'size'),
+                                       **{col: (col, 'sum') for col in sums})
+        total = part if total is None else total.add(part, fill_value=0)
+
+        if count_unique:
+            for group, values in chunk.groupby(keys, observed=True)['restaurant_id']:
+                ids.setdefault(group, set()).update(values)
+
+    if total is None:
+        return pd.DataFrame(columns=keys + ['rows'] + sums)
+
+    total['rows'] = total['rows'].astype('int64')
+    for col in sums:
+        total['mean_' + col] = total[col] / total['rows']
+    if count_unique:
+        groups = [group if isinstance(group, tuple) else (group,) for group in total.index]
+        total['restaurants'] = [len(ids[group]) for group in groups]
+    return total.reset_index()
+
+def main():
+    parser = argparse.ArgumentParser(description='Stream a zomato export into parquet')
+    parser.add_argument('path', nargs='?', default=ZIP_PATH)
+    parser.add_argument('--member', default=None)
+    parser.add_argument('--chunksize', type=int, default=CHUNKSIZE)
+    parser.add_argument('--out', default='datasets/snapshots/stream.parquet')
+    args = parser.parse_args()
+
+    rows = write_parquet(iter_formatted_chunks(args.path, args.member, args.chunksize), args.out)
+    print('{} rows -> {}'.format(rows, args.out))
+
+if __name__ == '__main__':
+    main()
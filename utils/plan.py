@@ -0,0 +1,163 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.cube import ROLLUP_METRICS, rollup
+from utils.filters import materialize
+
+# Declarative aggregation plans. A chart states what it needs as an
+# Aggregation (group keys + named metrics); execute() answers the whole
+# page's plan at once:
+#
+#   1. cube    every aggregation the cube can answer for the filter key
+#   2. scan    one groupby over the filtered rows by the union of the keys
+#              left, collecting sums and counts for every decomposable metric
+#   3. distinct one drop_duplicates per nunique column over the same keys
+#   4. rollup  each aggregation regrouped from those small tables
+#
+# so N charts cost one pass over the rows instead of N. Timings of every
+# stage are returned next to the results. df may be a FilteredView: only the
+# columns the scan reads are then gathered, and none when the cube answers
+# the whole plan.
+
+
+class Aggregation:
+
+    def __init__(self, name, keys, metrics):
+        # metrics: {output column: (input column, 'sum'|'mean'|'size'|'count'|'min'|'max'|'nunique')}
+        self.name = name
+        self.keys = list(keys)
+        self.metrics = dict(metrics)
+
+    def __repr__(self):
+        return 'Aggregation({!r}, {!r}, {!r})'.format(self.name, self.keys, self.metrics)
+
+
+def from_cube(agg, key):
+    # agg answered by a cube rollup, or None
+    columns = {}
+    for out, metric in agg.metrics.items():
+        if metric not in ROLLUP_METRICS:
+            return None
+        columns[out] = ROLLUP_METRICS[metric]
+
+    distinct = any(func == 'nunique' for _, func in agg.metrics.values())
+    cells = rollup(key, agg.keys, distinct=distinct)
+    if cells is None:
+        return None
+    out = cells[list(columns.values())].set_axis(list(columns), axis=1)
+    # counts come back as floats from a grand total
+    for name, (_, func) in agg.metrics.items():
+        if func in ('nunique', 'size', 'count'):
+            out[name] = out[name].astype('int64')
+    return out
+
+def regroup(table, keys, columns, funcs):
+    if len(keys) == 0:
+        return table[columns].agg(funcs).to_frame().T
+    return table.groupby(keys, observed=True)[columns].agg(funcs)
+
+def execute(plan, df, key=None):
+    # Returns ({aggregation name: frame indexed by its keys}, [(stage, seconds)])
+    results = {}
+    timings = []
+
+    start = time.perf_counter()
+    pending = []
+    for agg in plan:
+        out = from_cube(agg, key) if key is not None else None
+        if out is None:
+            pending.append(agg)
+        else:
+            results[agg.name] = out
+    if key is not None:
+        timings.append(('cube', time.perf_counter() - start))
+    if len(pending) == 0:
+        return results, timings
+
+    # Union of the group keys still to answer, in first-seen order
+    keys = []
+    for agg in pending:
+        keys += [k for k in agg.keys if k not in keys]
+
+    # 2. single scan: sum / count / min / max of every decomposable column
+    start = time.perf_counter()
+    df = materialize(df, keys + ['restaurant_id'] + [col for agg in pending for col, _ in agg.metrics.values()])
+    scan = {'__rows': ('restaurant_id', 'size')}
+    for agg in pending:
+        for col, func in agg.metrics.values():
+            if func in ('sum', 'mean'):
+                scan[col + '__sum'] = (col, 'sum')
+            if func in ('mean', 'count'):
+                scan[col + '__count'] = (col, 'count')
+            if func in ('min', 'max'):
+                scan[col + '__' + func] = (col, func)
+    if len(keys) == 0:
+        fine = pd.DataFrame({name: [df[col].agg(func)] for name, (col, func) in scan.items()})
+    else:
+        fine = df.groupby(keys, observed=True).agg(**scan).reset_index()
+    timings.append(('scan', time.perf_counter() - start))
+
+    # 3. distinct (keys, value) pairs for nunique metrics
+    start = time.perf_counter()
+    distinct = {}
+    for agg in pending:
+        for col, func in agg.metrics.values():
+            if func == 'nunique' and col not in distinct:
+                distinct[col] = df[keys + [col]].drop_duplicates()
+    if distinct:
+        timings.append(('distinct', time.perf_counter() - start))
+
+    # 4. every aggregation from the small tables
+    start = time.perf_counter()
+    for agg in pending:
+        out = {}
+        for name, (col, func) in agg.metrics.items():
+            if func == 'nunique':
+                out[name] = regroup(distinct[col], agg.keys, [col], 'nunique')[col]
+            elif func == 'size':
+                out[name] = regroup(fine, agg.keys, ['__rows'], 'sum')['__rows']
+            elif func == 'count':
+                out[name] = regroup(fine, agg.keys, [col + '__count'], 'sum')[col + '__count']
+            elif func == 'sum':
+                out[name] = regroup(fine, agg.keys, [col + '__sum'], 'sum')[col + '__sum']
+            elif func == 'mean':
+                sums = regroup(fine, agg.keys, [col + '__sum', col + '__count'], 'sum')
+                out[name] = sums[col + '__sum'] / sums[col + '__count']
+            elif func in ('min', 'max'):
+                out[name] = regroup(fine, agg.keys, [col + '__' + func], func)[col + '__' + func]
+            else:
+                raise ValueError('unknown aggregation {!r}'.format(func))
+        results[agg.name] = pd.DataFrame(out)
+    timings.append(('rollup', time.perf_counter() - start))
+
+    return results, timings
+
+def fold_top(frame, n, order_by, weights=None, key=None, other='Other'):
+    # Keep the n groups of `key` (an index level, the first by default) with
+    # the largest total `order_by` and fold the rest into one `other` group
+    # per remaining key. Columns in weights ({mean column: weight column})
+    # are re-averaged with their weights; every other column is summed, so
+    # distinct counts stay exact only when the folded groups share no
+    # values. Groups come out by descending total, `other` last.
+    weights = weights or {}
+    keys = list(frame.index.names)
+    key = key or keys[0]
+
+    table = frame.reset_index()
+    table[key] = table[key].astype(object)
+    totals = table.groupby(key, sort=False)[order_by].sum().sort_values(ascending=False, kind='stable')
+    top = list(totals.index[:n])
+    if len(totals) > n:
+        table.loc[~table[key].isin(top), key] = other
+        top.append(other)
+
+    for col, weight in weights.items():
+        table[col] = table[col] * table[weight]
+    table = table.groupby(keys, sort=False, observed=True).sum()
+    for col, weight in weights.items():
+        table[col] = table[col] / table[weight]
+
+    rank = table.index.get_level_values(key).map({value: i for i, value in enumerate(top)})
+    return table.iloc[np.argsort(rank, kind='stable')]
@@ -0,0 +1,135 @@
+import argparse
+import json
+import sys
+
+import pandas as pd
+
+from utils.cache import result_cache
+from utils.data import load_dataset
+from utils.filters import filter_view
+from utils.plan import Aggregation, execute, fold_top
+
+# The dashboards' numbers without Streamlit: the sidebar filters of
+# sidebar_filters/filter_df as parameters, the aggregates answered by the
+# same plan executor (cube first, then one scan) over the shared frame.
+#
+#   from utils.query import query
+#   query(load_dataset(), by=['city'], countries=['India'], delivery='yes', top=10)
+#
+# From the command line, one query or a batch (one JSON object of the same
+# parameters per line), the dataset loaded once for the whole batch:
+#
+#   python -m utils.query --by country_name --countries India Brazil --format json
+#   python -m utils.query --batch queries.jsonl --format csv --out results.csv
+
+# Metrics of every query, as the charts compute them
+METRICS = {'restaurants': ('restaurant_id', 'nunique'), 'rows': ('restaurant_id', 'size'),
+           'mean_rating': ('aggregate_rating', 'mean'), 'mean_votes': ('votes', 'mean'),
+           'mean_cost_for_two': ('average_cost_for_two', 'mean')}
+# mean columns re-averaged with the row counts when groups are folded
+WEIGHTS = {'mean_rating': 'rows', 'mean_votes': 'rows', 'mean_cost_for_two': 'rows'}
+
+# Columns the delivery / booking filters read: Home and Company filter on
+# is_delivering_now / has_table_booking, Restaurants and the Geographic View
+# on has_delivery / has_booking
+SERVICES = {'company': ('is_delivering_now', 'has_table_booking'),
+            'restaurants': ('has_delivery', 'has_booking')}
+DELIVERY = {'yes': [1], 'no': [0], 'both': [1, 0]}
+
+GROUP_COLUMNS = ['country_name', 'city', 'cuisines', 'price_range_type', 'has_delivery',
+                 'has_booking', 'is_delivering_now', 'has_table_booking']
+
+
+def selections(df, countries=None, cities=None, price_ranges=None, delivery='both', booking=False,
+               services='company'):
+    # The selections filter_df builds from the sidebar; an empty or missing
+    # list selects everything, as an empty multiselect does
+    delivery_column, booking_column = SERVICES[services]
+    return {'price_range_type': price_ranges or df['price_range_type'].unique(),
+            'country_name': countries or df['country_name'].unique(),
+            'city': cities or df['city'].unique(),
+            delivery_column: DELIVERY[delivery],
+            booking_column: [1] if booking else [1, 0]}
+
+def query(df, by=None, countries=None, cities=None, price_ranges=None, max_price=None,
+          delivery='both', booking=False, services='company', top=None):
+    # Metrics grouped by the columns of `by` (totals when empty), groups by
+    # descending restaurant count; top folds all but the first `top` groups
+    # of by[0] into "Other", as the charts do
+    by = list(by or [])
+    unknown = [col for col in by if col not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError('cannot group by {}; choose from {}'.format(unknown, GROUP_COLUMNS))
+    if delivery not in DELIVERY:
+        raise ValueError('delivery must be one of {}'.format(list(DELIVERY)))
+
+    view, key = filter_view(df, selections(df, countries, cities, price_ranges, delivery, booking, services),
+                            max_cost=max_price)
+    plan = [Aggregation('query', by, METRICS)]
+    table = result_cache.get_or_compute(key + ('query', tuple(by)), lambda: execute(plan, view, key)[0]['query'])
+
+    if len(by) == 0:
+        return table.reset_index(drop=True)
+    if top is not None:
+        return fold_top(table, top, 'restaurants', weights=WEIGHTS).reset_index()
+    return table.sort_values('restaurants', ascending=False, kind='stable').reset_index()
+
+def parameters(args):
+    # query() keyword arguments of the command line flags
+    return {'by': args.by, 'countries': args.countries, 'cities': args.cities,
+            'price_ranges': args.price_ranges, 'max_price': args.max_price, 'delivery': args.delivery,
+            'booking': args.booking, 'services': args.services, 'top': args.top}
+
+def read_batch(path):
+    # [(name, parameters)] of a JSON lines file; name defaults to the line number
+    queries = []
+    with open(path) if path != '-' else sys.stdin as f:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                params = json.loads(line)
+                queries.append((str(params.pop('name', number)), params))
+    return queries
+
+def write(results, fmt, out):
+    # results: [(name, frame)]. CSV: one table, the query name first; JSON:
+    # one object per query with its rows
+    if fmt == 'csv':
+        if len(results) == 1:
+            results[0][1].to_csv(out, index=False)
+        else:
+            table = pd.concat([frame.assign(query=name) for name, frame in results], ignore_index=True)
+            table[['query'] + [col for col in table.columns if col != 'query']].to_csv(out, index=False)
+    else:
+        for name, frame in results:
+            out.write(json.dumps({'query': name, 'rows': json.loads(frame.to_json(orient='records'))}) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="the dashboards' aggregates under a sidebar filter, without the UI")
+    parser.add_argument('--path', help='csv to load instead of the shipped one')
+    parser.add_argument('--by', nargs='*', default=[], help='group columns: ' + ', '.join(GROUP_COLUMNS))
+    parser.add_argument('--countries', nargs='*')
+    parser.add_argument('--cities', nargs='*')
+    parser.add_argument('--price-ranges', nargs='*')
+    parser.add_argument('--max-price', type=float)
+    parser.add_argument('--delivery', choices=list(DELIVERY), default='both')
+    parser.add_argument('--booking', action='store_true', help='only restaurants taking bookings')
+    parser.add_argument('--services', choices=list(SERVICES), default='company',
+                        help='delivery/booking columns filtered, as on that page')
+    parser.add_argument('--top', type=int, help='groups kept before folding the rest into Other')
+    parser.add_argument('--batch', help='JSON lines file of queries (- for stdin)')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--out', help='output file (stdout by default)')
+    args = parser.parse_args()
+
+    df = load_dataset(args.path)
+    queries = read_batch(args.batch) if args.batch else [('query', parameters(args))]
+    results = [(name, query(df, **params)) for name, params in queries]
+
+    if args.out:
+        with open(args.out, 'w', newline='') as out:
+            write(results, args.format, out)
+    else:
+        write(results, args.format, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+from utils.cube import get_cube
+from utils.data import load_dataset
+from utils.figures import dual_axis_chart
+from utils.filters import FilteredView, get_filter_index, filter_view
+from utils.geo import cluster_points
+from utils.plan import Aggregation, execute, fold_top
+from utils.topk import top_k
+
+# Weekly static reports, one per country and one per major city, with what
+# the Company, Restaurants and Geographic View pages show for that filter:
+#
+#   <out>/country/<name>.json|html   <out>/city/<name>.json|html
+#
+# The dataset is loaded once, its filter index and cube built, and the
+# report jobs fanned out over a process pool: workers forked from this
+# process share all of it; where processes are spawned each worker loads it
+# once instead. A report is skipped when the hash of its input rows (and of
+# REPORT_VERSION and its formats) matches <out>/manifest.json and its files
+# are there, so a new export only rebuilds the reports whose rows changed.
+#
+#   python -m utils.reports --out reports --cities 20 --workers 8
+
+REPORT_VERSION = 1
+OUT_DIR = 'reports'
+
+METRICS = {'restaurants': ('restaurant_id', 'nunique'), 'mean': ('aggregate_rating', 'mean'),
+           'rows': ('restaurant_id', 'size')}
+MEANS = {'aggregate_rating': ('aggregate_rating', 'mean'), 'average_cost_for_two': ('average_cost_for_two', 'mean')}
+# Company and Restaurants plans in one
+PLAN = [
+    Aggregation('home', [], METRICS),
+    Aggregation('country_rests', ['country_name'], METRICS),
+    Aggregation('city_rests', ['city'], METRICS),
+    Aggregation('cuisines', ['cuisines'], METRICS),
+    Aggregation('has_delivery', ['has_delivery'], MEANS),
+    Aggregation('has_booking', ['has_booking'], MEANS),
+    Aggregation('price_types', ['cuisines', 'price_range_type'], {'restaurant_id': ('restaurant_id', 'nunique')}),
+    Aggregation('cost_rating', ['cuisines'], dict(MEANS, restaurants=('restaurant_id', 'nunique'))),
+]
+TOP_N = {'city_rests': 30, 'cuisines': 20, 'price_types': 25}
+
+_df = None
+
+
+def slug(name):
+    return re.sub(r'[^\w-]+', '_', str(name)).strip('_')
+
+def jobs(df, n_cities):
+    # [(kind, name, selections)]: every country, then the n_cities cities
+    # with the most restaurants
+    countries = sorted(df['country_name'].unique())
+    cities = df.groupby('city', observed=True)['restaurant_id'].nunique().sort_values(ascending=False, kind='stable')
+    return ([('country', name, {'country_name': [name]}) for name in countries] +
+            [('city', name, {'city': [name]}) for name in cities.index[:n_cities]])
+
+def input_hashes(df, specs, formats):
+    # {(kind, name): hash of the rows the report reads, REPORT_VERSION and
+    # the formats}; one row hash pass for all reports
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    index = get_filter_index(df)
+    hashes = {}
+    for kind, name, selections in specs:
+        digest = hashlib.sha1(row_hashes[np.flatnonzero(index.select(selections))].tobytes())
+        digest.update(json.dumps([REPORT_VERSION, sorted(formats)]).encode())
+        hashes[(kind, name)] = digest.hexdigest()
+    return hashes
+
+def map_zoom(view):
+    # Mapbox zoom that fits the rows (within 1 and 12)
+    span = max(np.ptp(view['longitude'].to_numpy(dtype=float)),
+               2 * np.ptp(view['latitude'].to_numpy(dtype=float)), 0.01)
+    return int(np.clip(np.log2(360 / span), 1, 12))
+
+def aggregates(df, selections):
+    # Everything the three pages compute for the selection
+    view, key = filter_view(df, selections)
+    results, _ = execute(PLAN, view, key)
+
+    rests = view.select(['restaurant_name', 'aggregate_rating', 'votes'])
+    best = top_k(rests, 1, by=['aggregate_rating', 'votes'], ascending=[False, False]).iloc[0]
+    worst = top_k(rests, 1, by=['aggregate_rating', 'votes'], ascending=[True, False]).iloc[0]
+    metrics = {'restaurants': int(results['home']['restaurants'].iloc[0]),
+               'countries': len(results['country_rests']), 'cities': len(results['city_rests']),
+               'mean_rating': round(float(results['home']['mean'].iloc[0]), 2),
+               'best': best['restaurant_name'], 'best_rating': float(best['aggregate_rating']),
+               'worst': worst['restaurant_name'], 'worst_rating': float(worst['aggregate_rating'])}
+
+    zoom = map_zoom(view)
+    tables = {
+        'country_rests': results['country_rests'].round(2).reset_index().sort_values('restaurants', ascending=False),
+        'city_rests': fold_top(results['city_rests'], TOP_N['city_rests'], 'restaurants', weights={'mean': 'rows'}).round(2).reset_index(),
+        'cuisines': fold_top(results['cuisines'], TOP_N['cuisines'], 'restaurants', weights={'mean': 'rows'}).round(2).reset_index(),
+        'has_delivery': results['has_delivery'].round(2).reset_index().astype({'has_delivery': 'string'}),
+        'has_booking': results['has_booking'].round(2).reset_index().astype({'has_booking': 'string'}),
+        'price_types': fold_top(results['price_types'], TOP_N['price_types'], 'restaurant_id').reset_index(),
+        'cost_rating': results['cost_rating'].round(2).reset_index(),
+        'clusters': cluster_points(view, zoom, 'cuisines'),
+    }
+    return metrics, tables, zoom
+
+def figures(tables, zoom):
+    # (title, figure) of every chart of the pages
+    clusters = tables['clusters']
+    return [
+        ('Restaurants by Country', dual_axis_chart(tables['country_rests'], x='country_name', bar='restaurants', line='mean', bar_name='Restaurants by Country')),
+        ('Restaurants by Cities', dual_axis_chart(tables['city_rests'], x='city', bar='restaurants', line='mean', bar_name='Restaurants by City')),
+        ('Most Popular Cuisines', dual_axis_chart(tables['cuisines'], x='cuisines', bar='restaurants', line='mean', bar_name='Restaurants by Cuisines')),
+        ('Has Delivery', dual_axis_chart(tables['has_delivery'], x='has_delivery', bar='average_cost_for_two', line='aggregate_rating',
+                                         bar_name='Averace Price', bar_title=' Average Price ')),
+        ('Has Booking', dual_axis_chart(tables['has_booking'], x='has_booking', bar='average_cost_for_two', line='aggregate_rating',
+                                        bar_name='Averace Price', bar_title=' Average Price ')),
+        ('Price type distribution by Cuisines', px.bar(tables['price_types'], x='cuisines', y='restaurant_id', color='price_range_type')),
+        ('Do the most expensive restaurants get the best ratings?', px.scatter(tables['cost_rating'], x='average_cost_for_two',
+                                                                               y='aggregate_rating', hover_name='cuisines')),
+        ('Restaurants World Map', px.scatter_mapbox(clusters, lat='latitude', lon='longitude', color='cuisines', size='count',
+                                                    hover_data=['count', 'mean_rating', 'share'], zoom=zoom,
+                                                    mapbox_style='open-street-map')),
+    ]
+
+def write_html(path, title, metrics, figs):
+    parts = ['<html><head><meta charset="utf-8"><title>{}</title></head><body>'.format(title),
+             '<h1>{}</h1>'.format(title), '<table>']
+    parts += ['<tr><th>{}</th><td>{}</td></tr>'.format(name, value) for name, value in metrics.items()]
+    parts.append('</table>')
+    for i, (heading, fig) in enumerate(figs):
+        parts.append('<h2>{}</h2>'.format(heading))
+        parts.append(pio.to_html(fig, full_html=False, include_plotlyjs='cdn' if i == 0 else False))
+    parts.append('</body></html>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(parts))
+
+def init_worker(path):
+    # Forked workers already hold the frame; spawned ones load it once
+    global _df
+    if _df is None:
+        _df = load_dataset(path)
+
+def build_report(kind, name, selections, out, formats, input_hash):
+    start = time.perf_counter()
+    metrics, tables, zoom = aggregates(_df, selections)
+    target = os.path.join(out, kind, slug(name))
+    title = '{}: {}'.format(kind.capitalize(), name)
+
+    if 'json' in formats:
+        report = {'report': title, 'selections': selections, 'input_hash': input_hash, 'metrics': metrics,
+                  'tables': {table: json.loads(frame.to_json(orient='records')) for table, frame in tables.items()}}
+        with open(target + '.json', 'w', encoding='utf-8') as f:
+            json.dump(report, f)
+    if 'html' in formats:
+        write_html(target + '.html', title, metrics, figures(tables, zoom))
+    return kind, name, time.perf_counter() - start
+
+def outputs(out, kind, name, formats):
+    return [os.path.join(out, kind, slug(name) + '.' + fmt) for fmt in formats]
+
+def read_manifest(out):
+    path = os.path.join(out, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def write_manifest(out, manifest):
+    # written aside and renamed, as the snapshots are
+    path = os.path.join(out, 'manifest.json')
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def run(df, specs, out, formats, workers, force=False, path=None):
+    # Build the reports of specs whose input changed, on a pool of workers
+    # sharing df; returns the [(kind, name)] built. A failed report is
+    # reported and the others finish; the manifest keeps every finished one
+    # before the first failure is raised, so the next run only rebuilds
+    # what failed or changed.
+    global _df
+    _df = df
+    hashes = input_hashes(df, specs, formats)
+    manifest = read_manifest(out)
+
+    todo = [(kind, name, selections) for kind, name, selections in specs
+            if force or manifest.get('{}/{}'.format(kind, name)) != hashes[(kind, name)]
+            or not all(os.path.exists(target) for target in outputs(out, kind, name, formats))]
+    for kind in ('country', 'city'):
+        os.makedirs(os.path.join(out, kind), exist_ok=True)
+    print('{} reports, {} unchanged, {} to build on {} workers'.format(
+        len(specs), len(specs) - len(todo), len(todo), workers), flush=True)
+
+    built, failed = [], []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(path,)) as pool:
+            futures = {pool.submit(build_report, kind, name, selections, out, formats, hashes[(kind, name)]): (kind, name)
+                       for kind, name, selections in todo}
+            for future in as_completed(futures):
+                kind, name = futures[future]
+                try:
+                    _, _, seconds = future.result()
+                except Exception as exc:
+                    failed.append(exc)
+                    print('  {:<8} {:<32} failed: {!r}'.format(kind, name, exc), flush=True)
+                    continue
+                manifest['{}/{}'.format(kind, name)] = hashes[(kind, name)]
+                built.append((kind, name))
+                print('  {:<8} {:<32} {:>7.2f}s'.format(kind, name, seconds), flush=True)
+    finally:
+        write_manifest(out, manifest)
+    if failed:
+        raise failed[0]
+    return built
+
+def main():
+    parser = argparse.ArgumentParser(description='static report per country and major city')
+    parser.add_argument('--path', help='csv to load instead of the shipped one')
+    parser.add_argument('--out', default=OUT_DIR)
+    parser.add_argument('--cities', type=int, default=20, help='cities with the most restaurants to report on')
+    parser.add_argument('--formats', nargs='+', choices=['html', 'json'], default=['html', 'json'])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--force', action='store_true', help='rebuild unchanged reports too')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    df = load_dataset(args.path)
+    # built here so forked workers inherit them
+    get_cube(get_filter_index(df))
+    print('loaded in {:.1f}s'.format(time.perf_counter() - start))
+
+    start = time.perf_counter()
+    built = run(df, jobs(df, args.cities), args.out, args.formats, args.workers, args.force, args.path)
+    print('built {} reports in {:.1f}s'.format(len(built), time.perf_counter() - start))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+import argparse
+import io
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from utils.data import DATASET_PATH
+
+# Synthetic zomato exports for load tests. learn_profile() reads the
+# per-column distributions of the real csv; generate_chunks() samples rows
+# from them in fixed blocks of BLOCK_ROWS, each with its own seed derived from
+# (seed, block number), so the output for a seed is the same whatever the
+# size asked for or the chunking used to write it:
+#
+#   country/city      city frequencies of the real file
+#   locality          locality frequencies within the city
+#   coordinates       locality centroid + gaussian jitter (COORD_JITTER_DEG)
+#   cuisines          per-country vocabulary ranked by frequency, weights
+#                     following a Zipf law fitted on the real ranks; number
+#                     of cuisines per restaurant as in the real file
+#   price range       per country
+#   cost for two      resampled within (country, price range)
+#   booking/delivery  rates per (country, price range)
+#   rating            resampled within price range; colour fixed by the
+#                     rating, text resampled within (country, colour) so
+#                     the wording stays in the country's language
+#   votes             resampled within rating colour
+#   duplicates        exact repeats of earlier rows at the real rate
+#
+# Names and addresses are made up; nothing but place names, cuisine names
+# and value distributions comes from the real rows.
+#
+#   python -m utils.synth --rows 1000000 --seed 0 --out datasets/synthetic.csv.zip
+
+BLOCK_ROWS = 100_000
+COORD_JITTER_DEG = 0.005
+FIRST_ID = 100_000_000
+
+NAME_WORDS = ['Golden', 'Spice', 'Garden', 'Royal', 'Urban', 'Little', 'Blue', 'Green', 'Old',
+              'Grand', 'Hungry', 'Happy', 'Silver', 'Red', 'Corner', 'Street', 'House', 'Kitchen',
+              'Bistro', 'Cafe', 'Grill', 'Diner', 'Table', 'Oven', 'Bar', 'Lounge', 'Express', 'Point']
+
+
+def fit_zipf(counts):
+    # Exponent s of counts ~ rank^-s, least squares in log-log weighted by
+    # sqrt(count) so the head ranks, which carry the mass, drive the fit
+    counts = np.sort(np.asarray(counts, dtype=float))[::-1]
+    ranks = np.arange(1, len(counts) + 1)
+    if len(counts) < 2:
+        return 1.0
+    slope, _ = np.polyfit(np.log(ranks), np.log(counts), 1, w=np.sqrt(counts))
+    return float(-slope)
+
+def groups_of(df, keys, column):
+    # {group key: array of the column's values in that group}
+    return {key: group[column].to_numpy() for key, group in df.groupby(keys)}
+
+def learn_profile(path=DATASET_PATH):
+    raw = pd.read_csv(path)
+    columns = list(raw.columns)
+    profile = {'columns': columns}
+
+    # cities and their localities
+    cities = raw.groupby(['Country Code', 'City']).size().rename('rows').reset_index()
+    profile['cities'] = cities
+    profile['currency'] = raw.groupby('Country Code')['Currency'].first().to_dict()
+    localities = raw.groupby(['City', 'Locality', 'Locality Verbose']).agg(
+        rows=('Restaurant ID', 'size'), latitude=('Latitude', 'median'), longitude=('Longitude', 'median')).reset_index()
+    profile['localities'] = {city: group.reset_index(drop=True) for city, group in localities.groupby('City')}
+
+    # cuisines: Zipf weights over each country's ranked vocabulary
+    tokens = raw[['Country Code', 'Cuisines']].dropna()
+    tokens = tokens.assign(cuisine=tokens['Cuisines'].str.split(', ')).explode('cuisine')
+    profile['zipf_s'] = fit_zipf(tokens['cuisine'].value_counts().to_numpy())
+    profile['cuisine_vocab'] = {code: group['cuisine'].value_counts().index.to_numpy()
+                                for code, group in tokens.groupby('Country Code')}
+    n_cuisines = raw['Cuisines'].dropna().str.count(', ') + 1
+    profile['n_cuisines'] = n_cuisines.value_counts(normalize=True).sort_index()
+    profile['missing_cuisines'] = float(raw['Cuisines'].isna().mean())
+
+    # price, cost and services
+    profile['price_range'] = {code: group.value_counts(normalize=True)
+                              for code, group in raw.groupby('Country Code')['Price range']}
+    profile['cost'] = groups_of(raw, ['Country Code', 'Price range'], 'Average Cost for two')
+    flags = ['Has Table booking', 'Has Online delivery', 'Is delivering now', 'Switch to order menu']
+    profile['flags'] = raw.groupby(['Country Code', 'Price range'])[flags].mean()
+
+    # rating, colour, text and votes
+    profile['rating'] = groups_of(raw, 'Price range', 'Aggregate rating')
+    profile['rating_color'] = raw.groupby('Aggregate rating')['Rating color'].agg(lambda x: x.mode()[0]).to_dict()
+    profile['rating_text'] = groups_of(raw, ['Country Code', 'Rating color'], 'Rating text')
+    profile['any_rating_text'] = groups_of(raw, 'Rating color', 'Rating text')
+    profile['votes'] = groups_of(raw, 'Rating color', 'Votes')
+
+    profile['duplicate_rate'] = float(raw.duplicated().mean())
+    return profile
+
+def sample_within(rng, keys, groups):
+    # One value per row drawn from groups[key] of the row's key
+    out = np.empty(len(keys), dtype=object)
+    keys = pd.Series(list(keys)) if len(keys) and isinstance(keys[0], tuple) else pd.Series(keys)
+    for key, index in keys.groupby(keys, sort=False).indices.items():
+        values = groups[key]
+        out[index] = values[rng.integers(0, len(values), len(index))]
+    return out
+
+def generate_block(profile, block, n_rows, seed):
+    rng = np.random.default_rng([seed, block])
+
+    # country and city
+    cities = profile['cities']
+    city_rows = rng.choice(len(cities), n_rows, p=cities['rows'] / cities['rows'].sum())
+    country = cities['Country Code'].to_numpy()[city_rows]
+    city = cities['City'].to_numpy()[city_rows]
+
+    # locality and coordinates
+    locality = np.empty(n_rows, dtype=object)
+    verbose = np.empty(n_rows, dtype=object)
+    latitude = np.empty(n_rows)
+    longitude = np.empty(n_rows)
+    for name, index in pd.Series(city).groupby(city, sort=False).indices.items():
+        places = profile['localities'][name]
+        picked = rng.choice(len(places), len(index), p=places['rows'] / places['rows'].sum())
+        locality[index] = places['Locality'].to_numpy()[picked]
+        verbose[index] = places['Locality Verbose'].to_numpy()[picked]
+        latitude[index] = places['latitude'].to_numpy()[picked] + rng.normal(0, COORD_JITTER_DEG, len(index))
+        longitude[index] = places['longitude'].to_numpy()[picked] + rng.normal(0, COORD_JITTER_DEG, len(index))
+
+    # cuisines
+    n_cuisines = rng.choice(profile['n_cuisines'].index.to_numpy(), n_rows, p=profile['n_cuisines'].to_numpy())
+    cuisines = np.empty(n_rows, dtype=object)
+    for code, index in pd.Series(country).groupby(country, sort=False).indices.items():
+        vocab = profile['cuisine_vocab'].get(code)
+        if vocab is None:
+            vocab = profile['cuisine_vocab'][max(profile['cuisine_vocab'], key=lambda c: len(profile['cuisine_vocab'][c]))]
+        weights = np.arange(1, len(vocab) + 1, dtype=float) ** -profile['zipf_s']
+        picked = rng.choice(len(vocab), (len(index), int(n_cuisines.max())), p=weights / weights.sum())
+        for row, choices, k in zip(index, picked, n_cuisines[index]):
+            cuisines[row] = ', '.join(dict.fromkeys(vocab[choices[:k]]))
+    cuisines[rng.random(n_rows) < profile['missing_cuisines']] = None
+
+    # price range, cost and services
+    price = np.empty(n_rows, dtype=np.int64)
+    for code, index in pd.Series(country).groupby(country, sort=False).indices.items():
+        dist = profile['price_range'][code]
+        price[index] = rng.choice(dist.index.to_numpy(), len(index), p=dist.to_numpy())
+    keys = list(zip(country, price))
+    cost = sample_within(rng, keys, profile['cost']).astype(np.int64)
+    rates = profile['flags'].loc[keys].to_numpy()
+    flags = (rng.random(rates.shape) < rates).astype(np.int64)
+
+    # rating, colour, text and votes
+    rating = sample_within(rng, price, profile['rating']).astype(float)
+    color = pd.Series(rating).map(profile['rating_color']).to_numpy()
+    text_keys = list(zip(country, color))
+    texts = {key: profile['rating_text'].get(key, profile['any_rating_text'][key[1]]) for key in set(text_keys)}
+    text = sample_within(rng, text_keys, texts)
+    votes = sample_within(rng, color, profile['votes']).astype(np.int64)
+
+    ids = FIRST_ID + block * BLOCK_ROWS + np.arange(n_rows)
+    words = np.array(NAME_WORDS)
+    names = pd.Series(words[rng.integers(0, len(words), n_rows)]) + ' ' + pd.Series(words[rng.integers(0, len(words), n_rows)])
+    address = (pd.Series(rng.integers(1, 500, n_rows)).astype(str) + ', ' + pd.Series(verbose)).to_numpy()
+
+    df = pd.DataFrame({
+        'Restaurant ID': ids,
+        'Restaurant Name': names.to_numpy(),
+        'Country Code': country,
+        'City': city,
+        'Address': address,
+        'Locality': locality,
+        'Locality Verbose': verbose,
+        'Longitude': longitude.round(10),
+        'Latitude': latitude.round(10),
+        'Cuisines': cuisines,
+        'Average Cost for two': cost,
+        'Currency': pd.Series(country).map(profile['currency']).to_numpy(),
+        'Has Table booking': flags[:, 0],
+        'Has Online delivery': flags[:, 1],
+        'Is delivering now': flags[:, 2],
+        'Switch to order menu': flags[:, 3],
+        'Price range': price,
+        'Aggregate rating': rating,
+        'Rating color': color,
+        'Rating text': text,
+        'Votes': votes,
+    })[profile['columns']]
+
+    # exact repeats of earlier rows of the block, as in the real export
+    source = np.arange(n_rows)
+    repeats = np.flatnonzero(rng.random(n_rows) < profile['duplicate_rate'])
+    repeats = repeats[repeats > 0]
+    source[repeats] = rng.integers(0, repeats)
+    return df.iloc[source].reset_index(drop=True)
+
+def generate_chunks(profile, n_rows, seed=0):
+    # Blocks of BLOCK_ROWS rows (the last one shorter) until n_rows
+    for block in range((n_rows + BLOCK_ROWS - 1) // BLOCK_ROWS):
+        yield generate_block(profile, block, min(BLOCK_ROWS, n_rows - block * BLOCK_ROWS), seed)
+
+def write_csv(chunks, target, member='zomato.csv'):
+    # Stream chunks into a csv, or into `member` of a zip when target ends
+    # in .zip. Written to a temporary file first.
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    tmp = '{}.{}.tmp'.format(target, os.getpid())
+    rows = 0
+    try:
+        if target.endswith('.zip'):
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+                with archive.open(member, 'w', force_zip64=True) as stream:
+                    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+                    for chunk in chunks:
+                        chunk.to_csv(text, index=False, header=rows == 0)
+                        rows += len(chunk)
+                    text.flush()
+                    text.detach()
+        else:
+            with open(tmp, 'w', encoding='utf-8', newline='') as f:
+                for chunk in chunks:
+                    chunk.to_csv(f, index=False, header=rows == 0)
+                    rows += len(chunk)
+        os.replace(tmp, target)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic zomato export')
+    parser.add_argument('--source', default=DATASET_PATH, help='real csv the distributions are learned from')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='datasets/synthetic.csv.zip')
+    args = parser.parse_args()
+
+    profile = learn_profile(args.source)
+    rows = write_csv(generate_chunks(profile, args.rows, args.seed), args.out)
+    print('{} rows -> {}'.format(rows, args.out))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+# Top-k / bottom-k rows by several sort keys without sorting the frame.
+# Same result as
+#
+#   df.sort_values(by, ascending=ascending, kind='stable').head(k)
+#
+# (remaining ties keep row order, NaN last) but each key is a linear
+# np.partition over the rows still in contention: rows strictly ahead of the
+# k-th value are in, rows behind it are out, and only the ties at the k-th
+# value go on to the next key. The k winners are sorted at the end.
+
+
+def sort_key(series, ascending):
+    # float array where smaller is better
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+    else:
+        values = pd.factorize(series, sort=True)[0].astype(float)
+        values[values < 0] = np.nan
+    if not ascending:
+        values = -values
+    return np.where(np.isnan(values), np.inf, values)
+
+def select(keys, candidates, k):
+    # positions (into the key arrays) of the k best candidates, unordered
+    if k <= 0:
+        return candidates[:0]
+    if len(candidates) <= k:
+        return candidates
+    if len(keys) == 0:
+        # ties on every key: first rows win
+        return candidates[:k]
+
+    values = keys[0][candidates]
+    kth = np.partition(values, k - 1)[k - 1]
+    ahead = candidates[values < kth]
+    tied = candidates[values == kth]
+    return np.concatenate([ahead, select(keys[1:], tied, k - len(ahead))])
+
+def top_positions(df, k, by, ascending=True):
+    # Row positions of the top k rows of df, in sort order
+    if isinstance(by, str):
+        by = [by]
+    if isinstance(ascending, bool):
+        ascending = [ascending] * len(by)
+    keys = [sort_key(df[col], asc) for col, asc in zip(by, ascending)]
+
+    positions = select(keys, np.arange(len(df)), k)
+    # np.lexsort sorts by the last key first; position breaks the last ties
+    order = np.lexsort([positions] + [key[positions] for key in reversed(keys)])
+    return positions[order]
+
+def top_k(df, k, by, ascending=True):
+    return df.iloc[top_positions(df, k, by, ascending)]
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+from utils.filters import FilteredView
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Per-stage tracing of a page rerun. A page opens one Trace per rerun and
+# wraps each stage (load, sidebar, filter, aggregates, every chart) in
+# trace.stage(); each stage records its wall time, rows in and out and the
+# change of the process resident memory. finish() keeps the rerun in a
+# per-process history (the p50/p99 of the debug panel) and, when
+# ZOMATO_TRACE_FILE is set, writes it out:
+#
+#   *.jsonl   one line per rerun, appended
+#   *.prom    Prometheus text format (summary per page and stage over the
+#             history), rewritten on each rerun for a textfile collector
+#
+# "{pid}" in the path is replaced by the process id, so several server
+# processes do not write the same file. Percentiles over the JSONL files of
+# a whole run:  python -m utils.trace metrics/*.jsonl
+#
+# The memory delta is the process RSS, shared by every session of the
+# process: with concurrent sessions it also counts what the others did.
+
+TRACE_FILE = os.environ.get('ZOMATO_TRACE_FILE')
+HISTORY = int(os.environ.get('ZOMATO_TRACE_HISTORY', 1000))
+
+_lock = threading.Lock()
+_history = defaultdict(lambda: deque(maxlen=HISTORY))
+# (reruns, seconds) since the process started, for the Prometheus counters
+_totals = defaultdict(lambda: [0, 0.0])
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+
+def rss_bytes():
+    # Current resident memory of the process; the peak where /proc is
+    # missing (macOS), 0 where neither is available (Windows)
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        pass
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def rows_of(value):
+    # Row count of a frame, or of the frame first in a tuple
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    return len(value) if isinstance(value, (pd.DataFrame, pd.Series, np.ndarray, FilteredView)) else None
+
+
+class Stage:
+
+    def __init__(self, trace, name, rows_in):
+        self.trace = trace
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+
+    def __enter__(self):
+        self.depth = len(self.trace.open)
+        self.trace.open.append(self)
+        self.rss = rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.trace.open.pop()
+        self.trace.stages.append({'stage': self.name, 'depth': self.depth, 'seconds': seconds,
+                                  'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                                  'memory_mb': (rss_bytes() - self.rss) / 2**20})
+        return False
+
+
+class Trace:
+
+    def __init__(self, page):
+        self.page = page
+        self.stages = []
+        self.open = []
+        self.start = time.perf_counter()
+        self.rss = rss_bytes()
+
+    def stage(self, name, rows_in=None):
+        # with trace.stage('filter_df', rows_in=len(df)) as stage:
+        #     df = ...
+        #     stage.rows_out = len(df)
+        return Stage(self, name, rows_in)
+
+    def call(self, name, func, *args, rows_in=None, **kwargs):
+        # func(*args, **kwargs) as a stage, rows out taken from the result
+        with self.stage(name, rows_in) as stage:
+            result = func(*args, **kwargs)
+            stage.rows_out = rows_of(result)
+        return result
+
+    def add(self, name, seconds, rows_in=None, rows_out=None):
+        # A stage timed elsewhere (e.g. the steps of an aggregation plan),
+        # nested under the stages open now
+        self.stages.append({'stage': name, 'depth': len(self.open), 'seconds': seconds,
+                            'rows_in': rows_in, 'rows_out': rows_out, 'memory_mb': None})
+
+    def record(self):
+        # The rerun as one dict
+        return {'time': time.time(), 'pid': os.getpid(), 'page': self.page,
+                'seconds': time.perf_counter() - self.start,
+                'memory_mb': (rss_bytes() - self.rss) / 2**20, 'stages': self.stages}
+
+    def finish(self, path=TRACE_FILE):
+        record = self.record()
+        with _lock:
+            for stage, seconds in [('total', record['seconds'])] + [(s['stage'], s['seconds']) for s in self.stages]:
+                _history[(self.page, stage)].append(seconds)
+                _totals[(self.page, stage)][0] += 1
+                _totals[(self.page, stage)][1] += seconds
+            if path:
+                write(record, path.replace('{pid}', str(os.getpid())))
+        return record
+
+
+def percentiles(page):
+    # [(stage, reruns, p50 s, p99 s)] of the page over the history
+    with _lock:
+        series = [(stage, np.array(values)) for (name, stage), values in _history.items() if name == page]
+    return [(stage, len(values), float(np.percentile(values, 50)), float(np.percentile(values, 99)))
+            for stage, values in series]
+
+def write(record, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if not path.endswith('.prom'):
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        return
+
+    # summary per (page, stage) of every page seen by the process: quantiles
+    # over the history, sum and count since the start
+    lines = ['# HELP zomato_stage_seconds Wall time of a page stage per rerun',
+             '# TYPE zomato_stage_seconds summary']
+    for (page, stage), values in sorted(_history.items()):
+        values = np.array(values)
+        labels = 'page="{}",stage="{}"'.format(page, stage)
+        for quantile in (0.5, 0.99):
+            lines.append('zomato_stage_seconds{{{},quantile="{}"}} {:.6f}'.format(
+                labels, quantile, np.percentile(values, quantile * 100)))
+        count, total = _totals[(page, stage)]
+        lines.append('zomato_stage_seconds_sum{{{}}} {:.6f}'.format(labels, total))
+        lines.append('zomato_stage_seconds_count{{{}}} {}'.format(labels, count))
+    # write aside and rename, so the collector never reads a partial file
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp, path)
+
+def read(paths):
+    # Reruns of JSONL trace files
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def summary(records):
+    # Rows of (page, stage, reruns, p50 ms, p99 ms, mean rows out, mean MB)
+    series = defaultdict(list)
+    for record in records:
+        series[(record['page'], 'total')].append((record['seconds'], None, record['memory_mb']))
+        for stage in record['stages']:
+            series[(record['page'], stage['stage'])].append((stage['seconds'], stage['rows_out'], stage['memory_mb']))
+
+    rows = []
+    for (page, stage), values in sorted(series.items()):
+        seconds = np.array([v[0] for v in values])
+        rows_out = [v[1] for v in values if v[1] is not None]
+        memory = [v[2] for v in values if v[2] is not None]
+        rows.append((page, stage, len(values), np.percentile(seconds, 50) * 1000, np.percentile(seconds, 99) * 1000,
+                     np.mean(rows_out) if rows_out else float('nan'), np.mean(memory) if memory else float('nan')))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description='p50/p99 per page stage from JSONL trace files')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args()
+
+    print('{:<22} {:<22} {:>7} {:>10} {:>10} {:>11} {:>9}'.format(
+        'page', 'stage', 'reruns', 'p50 (ms)', 'p99 (ms)', 'rows out', 'mem (MB)'))
+    for row in summary(read(args.paths)):
+        print('{:<22} {:<22} {:>7} {:>10.1f} {:>10.1f} {:>11.0f} {:>9.2f}'.format(*row))
+
+if __name__ == '__main__':
+    main()
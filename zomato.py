@@ -4,116 +4,8 @@ import streamlit            as st
 import plotly.graph_objects as go 
 
 from plotly.subplots import make_subplots
-import inflection
-
-dataframe = pd.read_csv('datasets/zomato.csv')
-
-
-# Preenchimento do nome dos países
-
-def country_name(country_id):
-    COUNTRIES = {
-    1: "India",
-    14: "Australia",
-    30: "Brazil",
-    37: "Canada",
-    94: "Indonesia",
-    148: "New Zeland",
-    162: "Philippines",
-    166: "Qatar",
-    184: "Singapure",
-    189: "South Africa",
-    191: "Sri Lanka",
-    208: "Turkey",
-    214: "United Arab Emirates",
-    215: "England",
-    216: "United States of America",
-    }
-    return COUNTRIES[country_id]
-
-
-
-def to_dolar(country_name):
-    # Conversão dólar
-    CURRENCY = {
-     "India": 83,
-     "Australia": 1.47,
-     "Brazil": 5.20,
-     "Canada": 1.36,
-     "Indonesia": 15.97,
-     "New Zeland": 1.61,
-     "Philippines": 55.11,
-     "Qatar": 3.64,
-     "Singapure": 1.34,
-     "South Africa": 18.23,
-     "Sri Lanka": 365,
-     "Turkey": 19,
-     "United Arab Emirates": 3.7,
-     "England": 0.83,
-     "United States of America": 1,
-    }
-    return CURRENCY[country_name]
-
-def create_price_type(price_range):
-    # Criação do Tipo de Categoria de Comida
-    if price_range == 1:
-        return "cheap"
-    elif price_range == 2:
-        return "normal"
-    elif price_range == 3:
-        return "expensive"
-    else:
-        return "gourmet"
-
-def color_name(color_code):
-    # Criação do nome das Cores
-    COLORS = {
-    "3F7E00": "darkgreen",
-    "5BA829": "green",
-    "9ACD32": "lightgreen",
-    "CDD614": "orange",
-    "FFBA00": "red",
-    "CBCBC8": "darkred",
-    "FF7800": "darkred",
-    }
-    return COLORS[color_code]
-
-def rename_columns(dataframe):
-    # Renomear as colunas do DataFrame
-    df = dataframe.copy()
-    title = lambda x: inflection.titleize(x)
-    snakecase = lambda x: inflection.underscore(x)
-    spaces = lambda x: x.replace(" ", "")
-    cols_old = list(df.columns)
-    cols_old = list(map(title, cols_old))
-    cols_old = list(map(spaces, cols_old))
-    cols_new = list(map(snakecase, cols_old))
-    df.columns = cols_new
-    return df
-
-def format_df(dataframe):
-    # Formatting df
-    df = rename_columns(dataframe)
-    # Removing NaN
-    df = df.loc[~df['cuisines'].isna(),:]
-    # Removing columns
-    df = df.drop(columns=['switch_to_order_menu'])
-    # Column price_range_type
-    df['price_range_type'] = df['price_range'].apply(lambda x: create_price_type(x) )
-    # Column country_name
-    df['country_name'] = df['country_code'].apply(lambda x: country_name(x))  
-    # Columns color_name
-    df['color_name'] = df['rating_color'].apply(lambda x: color_name(x) ) 
-    # Cuisines
-    df['cuisines'] = df.loc[:, 'cuisines'].apply(lambda x: x.split(",")[0])
-    # Changing types
-    df.loc[: , ['restaurant_id','country_code']] = df.loc[: , ['restaurant_id','country_code']].astype(str)    
-    # Dolar conversion
-    df['dolar_price'] = df[['average_cost_for_two','country_name']].apply(lambda x: x['average_cost_for_two'] / to_dolar(x['country_name']), axis=1).round(2)
-    # Reset index
-    df = df.reset_index(drop=True)
-    
-    return df
+from utils.data import load_dataset
+
 
 def streamlit_config():
     st.set_page_config(layout="wide", page_title="Zomato Restaurants")  
@@ -345,7 +237,7 @@ def home(df):
 ## Streamlit Page
 streamlit_config()
 ## Dataframe
-df = format_df(dataframe)
+df = load_dataset()
 
 # SIDEBAR FILTERS
 country_multiselect, city_multiselect, price_range_multiselect, price_slider = sidebar_filters(df)